@@ -57,10 +57,10 @@ class VNS_TS(Evolution):
     nu_max = 30
     lambda_div = 1.0
     eta_tabu = 100
+    neighbor_opt = ('two_opt_star', 'relocate', 'exchange', 'stationInRe')  # tabu_search使用的Modification.*_arc 还可以加入'or_opt', 'two_opt', 'swap_star'
     # 状态属性
     vns_neighbour = []
     frequency = {}
-    possible_arc = {}
     SA_dist = None
     SA_feas = None
     penalty_update_flag = []
@@ -76,17 +76,15 @@ class VNS_TS(Evolution):
         self.SA_feas = Util.SA(self.Delta_SA, self.eta_feas)
         self.penalty_update_flag = [collections.deque(maxlen=self.eta_penalty), collections.deque(maxlen=self.eta_penalty), collections.deque(maxlen=self.eta_penalty)]
         self.calculate_possible_arc()
-        print(len(self.possible_arc))
 
     @staticmethod
     def penalty_capacity(route: Route, vehicle: Vehicle) -> float:
         if route.arrive_load_weight is None:
             route.cal_load_weight(vehicle)
+        if route.visit_index is None:
+            route.find_visit_index()
         penalty = max(route.arrive_load_weight[0]-vehicle.capacity, 0)
-        neg_demand_cus = []
-        for i, cus in enumerate(route.visit):
-            if cus.demand < 0:
-                neg_demand_cus.append(i)
+        neg_demand_cus = np.where(route.model.demand[route.visit_index] < 0)[0]
         for i in neg_demand_cus:
             penalty += max(route.arrive_load_weight[i]-vehicle.capacity, 0)
         return penalty
@@ -95,7 +93,9 @@ class VNS_TS(Evolution):
     def penalty_time(route: Route, vehicle: Vehicle) -> float:
         if route.arrive_time is None:
             route.cal_arrive_time(vehicle)
-        late_time = route.arrive_time-np.array([cus.over_time for cus in route.visit])
+        if route.visit_index is None:
+            route.find_visit_index()
+        late_time = route.arrive_time-route.model.over_time[route.visit_index]
         if_late = np.where(late_time > 0)[0]
         if len(if_late) > 0:
             return late_time[if_late[0]]
@@ -112,50 +112,28 @@ class VNS_TS(Evolution):
     def get_objective_route(route: Route, vehicle: Vehicle, penalty: list) -> float:
         if route.no_customer():
             return 0
-        return route.sum_distance()+penalty[0]*VNS_TS.penalty_capacity(route, vehicle)+penalty[1]*VNS_TS.penalty_time(route, vehicle)+penalty[2]*VNS_TS.penalty_battery(route, vehicle)
+        distance, capacity, time, battery, _ = route.cal_penalty(vehicle)
+        return distance+penalty[0]*capacity+penalty[1]*time+penalty[2]*battery
 
     @staticmethod
     def get_objective(solution: Solution, model: Model, penalty: list) -> float:
-        ret = 0
-        for route in solution.routes:
-            ret += VNS_TS.get_objective_route(route, model.vehicle, penalty)
-        return ret
+        return solution.get_objective(model, penalty, skip_empty=True)
 
     def calculate_possible_arc(self) -> None:
-        self.model.find_nearest_station()
-        all_node_list = [self.model.depot]+self.model.rechargers+self.model.customers
-        for node1 in all_node_list:
-            for node2 in all_node_list:
-                if (isinstance(node1, Depot) and isinstance(node2, Recharger) and (node1.x == node2.x and node1.y == node2.y)) or (isinstance(node1, Recharger) and isinstance(node2, Depot) and (node1.x == node2.x and node1.y == node2.y)):
-                    continue
-                if not node1 == node2:
-                    distance = node1.distance_to(node2)
-                    if isinstance(node1, Customer) and isinstance(node2, Customer) and (node1.demand+node2.demand) > self.model.vehicle.capacity:
-                        continue
-                    if node1.ready_time+node1.service_time+distance > node2.over_time:
-                        continue
-                    if node1.ready_time+node1.service_time+distance+node2.service_time+node2.distance_to(self.model.depot) > self.model.depot.over_time:
-                        continue
-                    if len(self.model.rechargers) != 0 and isinstance(node1, Customer) and isinstance(node2, Customer):
-                        recharger1 = self.model.nearest_station[node1][0]
-                        recharger2 = self.model.nearest_station[node2][0]
-                        if self.model.vehicle.battery_cost_speed*(node1.distance_to(recharger1)+distance+node2.distance_to(recharger2)) > self.model.vehicle.max_battery:
-                            continue
-                    if distance == 0:
-                        distance = 0.0000001
-                    self.possible_arc[(node1, node2)] = distance
+        if self.model.arc_indptr is None:
+            self.model.find_possible_arc()
 
     def select_possible_arc(self, N: int) -> list:
         selected_arc = []
-        keys = list(self.possible_arc.keys())
-        while len(keys) > 0 and len(selected_arc) < N:
-            values = [self.possible_arc[key] for key in keys]
-            values = np.array(values)
-            values = 1/values
+        arc_from = np.repeat(np.arange(len(self.model.nodes)), np.diff(self.model.arc_indptr))
+        values = 1/self.model.arc_weight
+        rest = np.arange(len(values))
+        while len(rest) > 0 and len(selected_arc) < N:
             #values = values/np.sum(values)
-            select = Util.wheel_select(values)
-            selected_arc.append(keys[select])
-            del keys[select]
+            select = Util.wheel_select(values[rest])
+            arc = rest[select]
+            selected_arc.append((self.model.nodes[arc_from[arc]], self.model.nodes[self.model.arc_indices[arc]]))
+            rest = np.delete(rest, select)
         return selected_arc
 
     def update_penalty(self, S: Solution) -> None:
@@ -186,6 +164,7 @@ class VNS_TS(Evolution):
         y = random.uniform(self.model.get_map_bound()[2], self.model.get_map_bound()[3])
         choose = self.model.customers[:]
         choose.sort(key=lambda cus: Util.cal_angle_AoB((self.model.depot.x, self.model.depot.y), (x, y), (cus.x, cus.y)))
+        distance = self.model.distance
         routes = []
         building_route_visit = [self.model.depot, self.model.depot]
 
@@ -197,7 +176,7 @@ class VNS_TS(Evolution):
                 min_increase_dis = float('inf')
                 decide_insert_place = None
                 for insert_place in allow_insert_place:
-                    increase_dis = choose[choose_index].distance_to(building_route_visit[insert_place-1])+choose[choose_index].distance_to(building_route_visit[insert_place])-building_route_visit[insert_place-1].distance_to(building_route_visit[insert_place])
+                    increase_dis = distance[choose[choose_index].index, building_route_visit[insert_place-1].index]+distance[choose[choose_index].index, building_route_visit[insert_place].index]-distance[building_route_visit[insert_place-1].index, building_route_visit[insert_place].index]
                     if increase_dis < min_increase_dis:
                         decide_insert_place = insert_place
                 if len(allow_insert_place) == 1:
@@ -216,7 +195,7 @@ class VNS_TS(Evolution):
 
             building_route_visit.insert(decide_insert_place, choose[choose_index])
 
-            try_route = Route(building_route_visit)
+            try_route = Route(building_route_visit, self.model)
             if try_route.feasible_capacity(self.model.vehicle)[0] and try_route.feasible_battery(self.model.vehicle)[0]:
                 del choose[choose_index]
             else:
@@ -225,12 +204,12 @@ class VNS_TS(Evolution):
                     if len(building_route_visit) == 2:
                         choose_index += 1
                     else:
-                        routes.append(Route(building_route_visit))
+                        routes.append(Route(building_route_visit, self.model))
                         building_route_visit = [self.model.depot, self.model.depot]
                 elif len(routes) == self.model.max_vehicle-1:
                     del choose[choose_index]
 
-        routes.append(Route(building_route_visit[:-1]+choose+[self.model.depot]))
+        routes.append(Route(building_route_visit[:-1]+choose+[self.model.depot], self.model))
 
         return Solution(routes)
 
@@ -245,25 +224,32 @@ class VNS_TS(Evolution):
         best_S = S
         #best_val = VNS_TS.get_objective(S, self.model, self.penalty)
         select_arc = self.select_possible_arc(100)
+        neighbor_opts = [getattr(Modification, name+'_arc') for name in self.neighbor_opt]
         tabu_list = {}
         for _ in range(self.eta_tabu):
-            local_best_S = None
-            local_best_act = None
+            neighbor = []
             for arc in select_arc:
-                for neighbor_opt in [Modification.two_opt_star_arc, Modification.relocate_arc, Modification.exchange_arc, Modification.stationInRe_arc]:
-                    neighbor_sol, neighbor_act = neighbor_opt(self.model, S, *arc)
-                    for sol in neighbor_sol:
-                        assert sol.serve_all_customer(self.model)
-                    for sol, act in zip(neighbor_sol, neighbor_act):
-                        if tabu_list.get(act, 0) == 0:
-                            if self.compare_better(sol, local_best_S):
-                                local_best_S = sol
-                                local_best_act = act
+                for neighbor_opt in neighbor_opts:
+                    for move in neighbor_opt(self.model, S, *arc):
+                        if tabu_list.get(move.act, 0) == 0:
+                            neighbor.append(move)
+            if len(neighbor) == 0:  # 邻域中的移动都被禁忌或都不可行
+                break
+            # 只评价改动的路径，选中的移动才生成解，生成相同解的移动只留第一个
+            neighbor = Move.evaluate_moves(neighbor, self.model, self.penalty)
+            local_best = neighbor[0]
+            for move in neighbor[1:]:
+                if VNS_TS.compare_value(move.value, local_best.value):
+                    local_best = move
+            local_best_S = local_best.materialize(self.model)
+            assert local_best_S.serve_all_customer(self.model)
             for key in tabu_list:
                 if tabu_list[key] >= 1:
                     tabu_list[key] -= 1
-            tabu_list[local_best_act] = random.randint(self.nu_min, self.nu_max)
-            if self.compare_better(local_best_S, best_S):
+            tabu_list[local_best.act] = random.randint(self.nu_min, self.nu_max)
+            objective, feasible = RouteBatch.evaluate_solutions([local_best_S, best_S], self.model, self.penalty, skip_empty=True)
+            value = [(len(sol), obj, feas) for sol, obj, feas in zip([local_best_S, best_S], objective, feasible)]
+            if VNS_TS.compare_value(value[0], value[1]):
                 best_S = local_best_S
             S = local_best_S
         return best_S
@@ -271,21 +257,24 @@ class VNS_TS(Evolution):
     def compare_better(self, solution1: Solution, solution2: Solution) -> bool:
         if solution2 is None:
             return True
-        s1_val = VNS_TS.get_objective(solution1, self.model, self.penalty)
-        s2_val = VNS_TS.get_objective(solution2, self.model, self.penalty)
-        if solution1.feasible(self.model) and solution2.feasible(self.model):
-            if len(solution1) < len(solution2) or (len(solution1) == len(solution2) and s1_val < s2_val):
-                # if solution1.get_actual_routes() < solution2.get_actual_routes() or (solution1.get_actual_routes() == solution2.get_actual_routes() and s1_val < s2_val):
-                return True
-        elif solution1.feasible(self.model) and not solution2.feasible(self.model):
-            return True
-        elif not solution1.feasible(self.model) and solution2.feasible(self.model):
-            return False
-        elif not solution1.feasible(self.model) and not solution2.feasible(self.model):
-            if s1_val < s2_val:
-                return True
-            else:
-                return False
+        value1 = (len(solution1), VNS_TS.get_objective(solution1, self.model, self.penalty), solution1.feasible(self.model))
+        value2 = (len(solution2), VNS_TS.get_objective(solution2, self.model, self.penalty), solution2.feasible(self.model))
+        return VNS_TS.compare_value(value1, value2)
+
+    @staticmethod
+    def compare_value(value1: tuple, value2: tuple) -> bool:
+        '''
+        value为(路径数, 目标值, 是否可行)，批量评价后直接比较
+        '''
+        len1, s1_val, feasible1 = value1
+        len2, s2_val, feasible2 = value2
+        if feasible1 and feasible2:
+            # if solution1.get_actual_routes() < solution2.get_actual_routes() or (solution1.get_actual_routes() == solution2.get_actual_routes() and s1_val < s2_val):
+            return len1 < len2 or (len1 == len2 and s1_val < s2_val)
+        elif feasible1 != feasible2:
+            return feasible1
+        else:
+            return s1_val < s2_val
 
     def acceptSA_feas(self, S2: Solution, S: Solution, i) -> bool:
         S2_objective = VNS_TS.get_objective(S2, self.model, self.penalty)
@@ -349,6 +338,7 @@ class DEMA(Evolution):
     tabu_len = 4
     local_search_step = 10
     charge_modify_step = 14
+    neighbor_opt = None  # MVS中tabu_search使用的邻域 None时同VNS_TS
     # 状态属性
     last_local_search = 0
     last_charge_modify = 0
@@ -364,18 +354,12 @@ class DEMA(Evolution):
 
     @ staticmethod
     def get_objective_route(route: Route, vehicle: Vehicle, penalty: tuple) -> float:
-        return route.sum_distance()+penalty[0]*VNS_TS.penalty_capacity(route, vehicle)+penalty[1]*VNS_TS.penalty_time(route, vehicle)+penalty[2]*VNS_TS.penalty_battery(route, vehicle)
+        distance, capacity, time, battery, _ = route.cal_penalty(vehicle)
+        return distance+penalty[0]*capacity+penalty[1]*time+penalty[2]*battery
 
     @ staticmethod
     def get_objective(solution: Solution, model: Model, penalty: tuple) -> float:
-        if solution.objective is None:
-            ret = 0
-            for route in solution.routes:
-                ret += DEMA.get_objective_route(route, model.vehicle, penalty)
-            solution.objective = ret
-            return ret
-        else:
-            return solution.objective
+        return solution.get_objective(model, penalty)
 
     @ staticmethod
     def overlapping_degree(solution1: Solution, solution2: Solution) -> float:
@@ -407,45 +391,28 @@ class DEMA(Evolution):
         choose.sort(key=lambda cus: Util.cal_angle_AoB((self.model.depot.x, self.model.depot.y), (x, y), (cus.x, cus.y)))
         routes = []
         building_route_visit = [self.model.depot, self.model.depot]
+        building_route = Route(building_route_visit[:], self.model)
 
         choose_index = 0
         while choose_index < len(choose):
-            allow_insert_place = list(range(1, len(building_route_visit)))
-
-            while True:
-                min_increase_dis = float('inf')
-                decide_insert_place = None
-                for insert_place in allow_insert_place:
-                    increase_dis = choose[choose_index].distance_to(building_route_visit[insert_place-1])+choose[choose_index].distance_to(building_route_visit[insert_place])-building_route_visit[insert_place-1].distance_to(building_route_visit[insert_place])
-                    if increase_dis < min_increase_dis:
-                        decide_insert_place = insert_place
-                if len(allow_insert_place) == 1:
-                    break
-                elif (isinstance(building_route_visit[decide_insert_place-1], Customer) and isinstance(building_route_visit[decide_insert_place], Customer)) and (building_route_visit[decide_insert_place-1].ready_time <= choose[choose_index].ready_time and choose[choose_index].ready_time <= building_route_visit[decide_insert_place].ready_time):
-                    break
-                elif (isinstance(building_route_visit[decide_insert_place-1], Customer) and not isinstance(building_route_visit[decide_insert_place], Customer)) and building_route_visit[decide_insert_place-1].ready_time <= choose[choose_index].ready_time:
-                    break
-                elif (not isinstance(building_route_visit[decide_insert_place-1], Customer) and isinstance(building_route_visit[decide_insert_place], Customer)) and choose[choose_index].ready_time <= building_route_visit[decide_insert_place]:
-                    break
-                elif not isinstance(building_route_visit[decide_insert_place-1], Customer) and not isinstance(building_route_visit[decide_insert_place], Customer):
-                    break
-                else:
-                    allow_insert_place.remove(decide_insert_place)
-                    continue
+            # 优先插入到达时间和载货量都可行的位置
+            _, decide_insert_place = Operation.best_insert(self.model, [Operation.insert_table(self.model, building_route)], [0], choose[choose_index])
 
             building_route_visit.insert(decide_insert_place, choose[choose_index])
 
-            try_route = Route(building_route_visit)
+            try_route = Route(building_route_visit[:], self.model)
             if try_route.feasible_capacity(self.model.vehicle)[0] and try_route.feasible_time(self.model.vehicle)[0]:
                 # del choose[choose_index]
                 choose_index += 1
+                building_route = try_route
             else:
                 del building_route_visit[decide_insert_place]
                 assert len(building_route_visit) != 2
-                routes.append(Route(building_route_visit))
+                routes.append(Route(building_route_visit, self.model))
                 building_route_visit = [self.model.depot, self.model.depot]
+                building_route = Route(building_route_visit[:], self.model)
 
-        routes.append(Route(building_route_visit))
+        routes.append(Route(building_route_visit, self.model))
 
         return Solution(routes)
 
@@ -548,8 +515,14 @@ class DEMA(Evolution):
     def ISSD(self, P: list, iter: int) -> list:
         SP1 = []
         SP2 = []
-        for sol in P:
-            if sol.feasible(self.model):
+        _, feasible = RouteBatch.evaluate_solutions(P, self.model, self.penalty)
+        # 重复的解只在种群不够时补进来
+        unique = set(Solution.unique_index(P))
+        duplicate = []
+        for i, (sol, feas) in enumerate(zip(P, feasible)):
+            if i not in unique:
+                duplicate.append(sol)
+            elif feas:
                 SP1.append(sol)
             else:
                 SP2.append(sol)
@@ -572,6 +545,9 @@ class DEMA(Evolution):
         for sol in SP2:
             if len(P) < self.size:
                 P.append(sol)
+        for sol in duplicate:
+            if len(P) < self.size:
+                P.append(sol)
         assert len(P) == self.size
 
         # for sol in P:
@@ -581,7 +557,10 @@ class DEMA(Evolution):
 
     def tabu_search_vnsts(self, solution: Solution) -> Solution:
         if getattr(self, 'vnsts', None) is None:
-            self.vnsts = VNS_TS(self.model)
+            if self.neighbor_opt is None:
+                self.vnsts = VNS_TS(self.model)
+            else:
+                self.vnsts = VNS_TS(self.model, neighbor_opt=self.neighbor_opt)
             self.vnsts.penalty = self.penalty
         sol = self.vnsts.tabu_search(solution)
         return sol
@@ -679,7 +658,11 @@ class DEMA(Evolution):
         return P
 
     def update_S(self, P: list) -> None:
-        for S in P:
+        # 相同的解只检查一次，与当前最优解相同的解不会替换它
+        for i in Solution.unique_index(P):
+            S = P[i]
+            if self.S_best is not None and S == self.S_best:
+                continue
             if S.feasible(self.model):
                 cost = DEMA.get_objective(S, self.model, self.penalty)
                 num = len(S.routes)
@@ -699,7 +682,17 @@ class DEMA(Evolution):
         if icecube is None:
             P = self.initialization()
         else:
-            self.model, self.S_best, self.min_cost, P = icecube
+            model, self.S_best, self.min_cost, P = icecube
+            if model.distance is None:  # 旧版本冻结的模型不完整，改用刚读入的模型，并把节点换成其中的对象
+                key_to_node = {node.key: node for node in self.model.nodes}
+                for sol in P+[self.S_best]:
+                    if sol is not None:
+                        for route in sol.routes:
+                            route.model = self.model
+                            route.visit = [key_to_node[node.key] for node in route.visit]
+                            route.find_visit_index()
+            else:
+                self.model = model
         self.update_S(P)
         for iter in range(self.maxiter_evo):
             print(iter, len(self.S_best), self.min_cost)
@@ -0,0 +1,195 @@
+'''
+路径状态计算的编译后端，安装了numba时Route使用这里的函数，否则使用原来的numpy实现\n
+运算顺序与numpy实现逐步相同，两个后端的结果完全一致\n
+环境变量EVRP_KERNEL可以指定numba、numpy，或python(不编译直接运行这里的循环，只用于核对结果)
+'''
+import os
+import numpy as np
+
+backend = os.environ.get('EVRP_KERNEL', '')
+if backend == '':
+    try:
+        import numba
+        backend = 'numba'
+    except ImportError:
+        backend = 'numpy'
+elif backend == 'numba':
+    import numba
+assert backend in ('numba', 'numpy', 'python')
+enabled = backend != 'numpy'
+
+
+def jit(func: object) -> object:
+    if backend == 'numba':
+        return numba.njit(cache=True)(func)
+    return func
+
+
+@jit
+def pairwise_sum(value: np.ndarray, start: int, end: int) -> float:
+    '''
+    与numpy对float64求和的分块方式相同
+    '''
+    n = end-start
+    if n < 8:
+        ret = 0.0
+        if n > 0:
+            ret = value[start]
+        for i in range(start+1, end):
+            ret += value[i]
+        return ret
+    elif n <= 128:
+        r = np.empty(8)
+        for j in range(8):
+            r[j] = value[start+j]
+        i = 8
+        while i < n-n % 8:
+            for j in range(8):
+                r[j] += value[start+i+j]
+            i += 8
+        ret = ((r[0]+r[1])+(r[2]+r[3]))+((r[4]+r[5])+(r[6]+r[7]))
+        for k in range(start+i, end):
+            ret += value[k]
+        return ret
+    else:
+        half = n//2
+        half -= half % 8
+        return pairwise_sum(value, start, start+half)+pairwise_sum(value, start+half, end)
+
+
+@jit
+def where_sum(value: np.ndarray, positive: bool) -> float:
+    '''
+    value.sum(where=value > 0)或value.sum(where=value < 0)，numpy对每一段连续被选中的元素分别求和再累加
+    '''
+    n = len(value)
+    ret = 0.0
+    i = 0
+    while i < n:
+        if (value[i] > 0) if positive else (value[i] < 0):
+            j = i
+            while j < n and ((value[j] > 0) if positive else (value[j] < 0)):
+                j += 1
+            ret = ret+pairwise_sum(value, i, j)
+            i = j
+        else:
+            i += 1
+    return ret
+
+
+@jit
+def load_weight(visit_index: np.ndarray, demand: np.ndarray) -> np.ndarray:
+    n = len(visit_index)
+    route_demand = np.empty(n)
+    for k in range(n):
+        route_demand[k] = demand[visit_index[k]]
+    start_load_weight = where_sum(route_demand, True)
+    ret = np.empty(n)
+    demand_vary = 0.0
+    for k in range(n):
+        demand_vary += route_demand[k]
+        ret[k] = start_load_weight-demand_vary
+    return ret
+
+
+@jit
+def recharge(remain_battery: np.ndarray, rechargers: np.ndarray, max_battery: float) -> None:
+    n = len(remain_battery)
+    for i in rechargers:
+        charge = max_battery-remain_battery[i]
+        for j in range(i+1, n):
+            remain_battery[j] += charge
+
+
+@jit
+def remain_battery(visit_index: np.ndarray, consume_battery: np.ndarray, rechargers: np.ndarray, max_battery: float) -> np.ndarray:
+    n = len(visit_index)
+    ret = np.empty(n)
+    consume = 0.0
+    ret[0] = max_battery-consume
+    for k in range(1, n):
+        consume += consume_battery[visit_index[k-1], visit_index[k]]
+        ret[k] = max_battery-consume
+    recharge(ret, rechargers, max_battery)
+    return ret
+
+
+@jit
+def remain_battery_weight(visit_index: np.ndarray, load_weight: np.ndarray, consume_battery: np.ndarray, consume_rate: np.ndarray, rechargers: np.ndarray, max_battery: float) -> np.ndarray:
+    n = len(visit_index)
+    ret = np.empty(n)
+    consume = 0.0
+    ret[0] = max_battery-consume
+    for k in range(1, n):
+        consume += consume_battery[visit_index[k-1], visit_index[k]]+consume_rate[visit_index[k-1], visit_index[k]]*load_weight[k-1]
+        ret[k] = max_battery-consume
+    recharge(ret, rechargers, max_battery)
+    return ret
+
+
+@jit
+def arrive_time(visit_index: np.ndarray, index: int, arrive: np.ndarray, travel_time: np.ndarray, service_time: np.ndarray, ready_time: np.ndarray, rechargers: np.ndarray, remain_battery: np.ndarray, max_battery: float, charge_speed: float) -> None:
+    '''
+    arrive[index]已知，原地计算之后的到达时间
+    '''
+    n = len(visit_index)
+    service = np.empty(n-index)
+    for k in range(index, n):
+        service[k-index] = service_time[visit_index[k]]
+    for i in rechargers:
+        if i >= index:
+            service[i-index] += (max_battery-remain_battery[i])*charge_speed
+    start_time = arrive[index]
+    consume = 0.0
+    before_service = 0.0
+    arrive[index] = consume+(start_time+before_service)
+    # 早到等待同Route.add_wait_time，延后量由不等待时的到达时间决定
+    no_wait = arrive[index]
+    delay = ready_time[visit_index[index]]-no_wait
+    for k in range(index+1, n):
+        if k > index+1:
+            delay = max(delay, ready_time[visit_index[k-1]]-no_wait)
+        consume += travel_time[visit_index[k-1], visit_index[k]]
+        before_service += service[k-1-index]
+        no_wait = consume+(start_time+before_service)
+        arrive[k] = no_wait+max(delay, 0.0)
+
+
+@jit
+def penalty(visit_index: np.ndarray, load_weight: np.ndarray, arrive: np.ndarray, remain_battery: np.ndarray, over_time: np.ndarray, demand: np.ndarray, capacity: float) -> tuple:
+    '''
+    返回(第一个超载位置, 超载量, 第一个迟到位置, 迟到时间, 第一个缺电位置, 缺电量)，没有时位置为-1，算法同Route.cal_penalty
+    '''
+    n = len(visit_index)
+    over = -1
+    over_weight = max(load_weight[0]-capacity, 0.0)
+    for k in range(n):
+        if load_weight[k] > capacity:
+            if over < 0:
+                over = k
+            if demand[visit_index[k]] < 0:
+                over_weight += load_weight[k]-capacity
+    late = -1
+    late_time = 0.0
+    for k in range(n):
+        if arrive[k] > over_time[visit_index[k]]:
+            late = k
+            late_time = arrive[k]-over_time[visit_index[k]]
+            break
+    lack = -1
+    for k in range(n):
+        if remain_battery[k] < 0:
+            lack = k
+            break
+    lack_battery = 0.0
+    if lack >= 0:
+        lack_battery = abs(where_sum(remain_battery, False))
+    return over, over_weight, late, late_time, lack, lack_battery
+
+
+@jit
+def first_over(load_weight: np.ndarray, capacity: float) -> int:
+    for k in range(len(load_weight)):
+        if load_weight[k] > capacity:
+            return k
+    return -1
@@ -1,37 +1,46 @@
+import os
 import random
+import hashlib
+import tempfile
+import zipfile
 import numpy as np
 from abc import ABCMeta
+from .spatial import Grid
+from . import kernel
 
 
 class Node(metaclass=ABCMeta):
-    # 构造属性
-    id = 0
-    x = 0.0
-    y = 0.0
-    demand = 0.0
-    ready_time = 0.0
-    over_time = 0.0
-    service_time = 0.0
+    # 构造属性 id x y demand ready_time over_time service_time
+    # 计算属性 index(在Model.nodes中的索引) key(由id和kind确定的整数，用于哈希和比较)
+    __slots__ = ('id', 'x', 'y', 'demand', 'ready_time', 'over_time', 'service_time', 'index', 'key')
+    kind = None  # 0仓库 1客户 2充电站
 
     def __init__(self, id: int, x: float, y: float) -> None:
         self.id = id
         self.x = x
         self.y = y
+        self.index = None
+        self.key = id*3+self.kind
 
     def __repr__(self) -> str:
         # return '{} {} at {}'.format(type(self).__name__, self.id, id(self))
         return '{} {}'.format(type(self).__name__, self.id)
 
-    def __hash__(self) -> str:
-        return hash(self.__class__.__name__+str(self.id))
+    def __hash__(self) -> int:
+        return self.key
 
     def __eq__(self, other) -> bool:
-        if type(self) != type(other):
-            return False
-        if self.id == other.id:
-            return True
-        else:
-            return False
+        return isinstance(other, Node) and self.key == other.key
+
+    def __getstate__(self) -> dict:
+        return {name: getattr(self, name) for name in Node.__slots__}
+
+    def __setstate__(self, state: dict) -> None:
+        # 旧版本pickle保存的是__dict__，没有index和key
+        self.index = None
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.key = self.id*3+self.kind
 
     def distance_to(self, node: object) -> float:
         assert isinstance(node, Node)
@@ -39,6 +48,9 @@ class Node(metaclass=ABCMeta):
 
 
 class Depot(Node):
+    __slots__ = ()
+    kind = 0
+
     def __init__(self, id: int, x: float, y: float, over_time: float) -> None:
         super().__init__(id, x, y)
         self.demand = 0.0
@@ -48,6 +60,9 @@ class Depot(Node):
 
 
 class Customer(Node):
+    __slots__ = ()
+    kind = 1
+
     def __init__(self, id: int, x: float, y: float, demand: float, ready_time: float, over_time: float, service_time: float) -> None:
         super().__init__(id, x, y)
         assert over_time >= ready_time
@@ -58,6 +73,9 @@ class Customer(Node):
 
 
 class Recharger(Node):
+    __slots__ = ()
+    kind = 2
+
     def __init__(self, id: int, x: float, y: float, over_time: float) -> None:
         super().__init__(id, x, y)
         self.demand = 0.0
@@ -92,10 +110,21 @@ class Route:
     arrive_time = None  # 刚到达时的时刻 向量
     adjacent_distance = None  # 两点距离 向量
     rechargers = None  # 充电桩索引 向量
-
-    def __init__(self, visit: list) -> None:
+    visit_index = None  # 访问节点在Model.nodes中的索引 向量
+    visit_kind = None  # 访问节点的类型 与visit_index同步 向量
+    position = None  # 中间各点的位置 (客户索引到位置 字典, 充电站索引到位置列表 字典)
+    fingerprint = None  # 各条边的Zobrist随机数之和 对2^64取模
+    cost = None  # cal_penalty的结果 修改后置为None 元组
+    useless = None  # has_useless_recharger的结果 修改后置为None
+    customers = None  # 客户数 修改后置为None
+    summary = None  # cal_summary的前缀和 修改后置为None 元组
+    shared = False  # 被多个解共用 修改前要用Solution.modify_route换成副本
+    model = None
+
+    def __init__(self, visit: list, model: object) -> None:
         assert isinstance(visit[0], Depot) and isinstance(visit[-1], Depot)
         self.visit = visit
+        self.model = model
 
     def __str__(self) -> str:
         retstr = 'Route: D{}'.format(self.visit[0].id)
@@ -118,34 +147,123 @@ class Route:
         return self.visit == other.visit
 
     def copy(self) -> object:
-        ret = Route(self.visit[:])
-        if self.arrive_load_weight is not None:
-            ret.arrive_load_weight = self.arrive_load_weight.copy()
-        if self.arrive_remain_battery is not None:
-            ret.arrive_remain_battery = self.arrive_remain_battery.copy()
-        if self.arrive_time is not None:
-            ret.arrive_time = self.arrive_time.copy()
-        if self.adjacent_distance is not None:
-            ret.adjacent_distance = self.adjacent_distance.copy()
-        if self.rechargers is not None:
-            ret.rechargers = self.rechargers.copy()
+        '''
+        状态向量更新时总是换成新的数组，不会原地修改，所以直接共用
+        '''
+        ret = Route.__new__(Route)
+        ret.visit = self.visit[:]
+        ret.model = self.model
+        ret.arrive_load_weight = self.arrive_load_weight
+        ret.arrive_remain_battery = self.arrive_remain_battery
+        ret.arrive_time = self.arrive_time
+        ret.adjacent_distance = self.adjacent_distance
+        ret.rechargers = self.rechargers
+        ret.visit_index = self.visit_index
+        ret.visit_kind = self.visit_kind
+        ret.position = self.position
+        ret.fingerprint = self.fingerprint
+        ret.cost = self.cost
+        ret.useless = self.useless
+        ret.customers = self.customers
+        ret.summary = self.summary
         return ret
 
     def sum_distance(self) -> float:
         if self.adjacent_distance is None:
             self.cal_adjacent_distance()
-        return np.sum(self.adjacent_distance)
+        return self.adjacent_distance.sum()
 
     def find_charge_station(self) -> None:
-        visit = np.array(self.visit)
-        test_recharger = np.vectorize(lambda node: isinstance(node, Recharger))
-        self.rechargers = np.where(test_recharger(visit))[0]
+        if self.visit_index is None:
+            self.find_visit_index()
+        self.rechargers = np.flatnonzero(self.visit_kind == Recharger.kind)
+
+    def find_visit_index(self) -> None:
+        self.visit_index = np.array([node.index for node in self.visit], dtype=int)
+        self.visit_kind = self.model.kind[self.visit_index]
+
+    def find_position(self) -> None:
+        if self.visit_index is None:
+            self.find_visit_index()
+        customer = {}
+        station = {}
+        for where, (index, kind) in enumerate(zip(self.visit_index[1:-1].tolist(), self.visit_kind[1:-1].tolist()), 1):
+            if kind == Customer.kind:
+                customer.setdefault(index, where)
+            elif kind == Recharger.kind:
+                station.setdefault(index, []).append(where)
+        self.position = (customer, station)
+
+    def cal_fingerprint(self) -> None:
+        if self.visit_index is None:
+            self.find_visit_index()
+        if self.model.arc_hash is None:
+            self.model.cal_arc_hash()
+        self.fingerprint = int(self.model.arc_hash[self.visit_index[:-1], self.visit_index[1:]].sum())
+
+    def get_fingerprint(self) -> int:
+        '''
+        访问序列相同的路径指纹相同，修改路径时只增减改动的边
+        '''
+        if self.fingerprint is None:
+            self.cal_fingerprint()
+        return self.fingerprint
+
+    def cal_summary(self) -> None:
+        '''
+        (访问节点索引, 距离, 反向距离, 客户数, 送货量)，都是列表\n
+        距离第i项为visit[:i+1]各边之和，反向距离为倒着走这些边之和，客户数和送货量第i项为visit[:i]之和\n
+        visit[lo:hi]的距离为距离[hi-1]-距离[lo]，客户数为客户数[hi]-客户数[lo]，用于Move.cal_bound拼接片段
+        '''
+        if self.visit_index is None:
+            self.find_visit_index()
+        index = self.visit_index
+        distance = np.zeros(len(index))
+        distance[1:] = np.cumsum(self.model.distance[index[:-1], index[1:]])
+        back_distance = np.zeros(len(index))
+        back_distance[1:] = np.cumsum(self.model.distance[index[1:], index[:-1]])
+        customer = np.zeros(len(index)+1, dtype=int)
+        customer[1:] = np.cumsum(self.visit_kind == Customer.kind)
+        demand = self.model.demand[index]
+        delivery = np.zeros(len(index)+1)
+        delivery[1:] = np.cumsum(np.where(demand > 0, demand, 0))
+        self.summary = (index.tolist(), distance.tolist(), back_distance.tolist(), customer.tolist(), delivery.tolist())
+
+    def get_summary(self) -> tuple:
+        if self.summary is None:
+            self.cal_summary()
+        return self.summary
+
+    def customer_num(self) -> int:
+        if self.customers is None:
+            if self.visit_index is None:
+                self.find_visit_index()
+            self.customers = int(np.count_nonzero(self.visit_kind == Customer.kind))
+        return self.customers
+
+    def find_left_right_stop(self, where: int) -> tuple:
+        '''
+        where两侧(不含where)最近的充电站或仓库的位置，where为两端时返回where本身
+        '''
+        if self.visit_index is None:
+            self.find_visit_index()
+        stops = np.flatnonzero(self.visit_kind != Customer.kind)
+        left = where if where == 0 else int(stops[np.searchsorted(stops, where)-1])
+        right = where if where == len(self.visit)-1 else int(stops[np.searchsorted(stops, where, side='right')])
+        return left, right
 
     def cal_adjacent_distance(self) -> None:
-        self.adjacent_distance = np.array(list(map(lambda i: self.visit[i].distance_to(self.visit[i+1]), range(len(self.visit)-1))))
+        if self.visit_index is None:
+            self.find_visit_index()
+        self.adjacent_distance = self.model.distance[self.visit_index[:-1], self.visit_index[1:]]
 
     def cal_load_weight(self, vehicle: Vehicle) -> None:
-        demand = np.array([cus.demand for cus in self.visit])
+        if self.visit_index is None:
+            self.find_visit_index()
+        if kernel.enabled:
+            self.arrive_load_weight = kernel.load_weight(self.visit_index, self.model.demand)
+            return
+        demand = self.model.demand[self.visit_index]
         start_load_weight = np.sum(demand, where=demand > 0)
         # if start_load_weight > vehicle.capacity:
         #    self.arrive_load_weight = np.array([start_load_weight])
@@ -158,67 +276,100 @@ class Route:
             self.cal_adjacent_distance()
         if self.rechargers is None:
             self.find_charge_station()
+        if self.visit_index is None:
+            self.find_visit_index()
+        if kernel.enabled:
+            self.arrive_remain_battery = kernel.remain_battery(self.visit_index, self.model.consume_battery, self.rechargers, vehicle.max_battery)
+            return
         adjacent_consume_battery = np.zeros(len(self.visit))
-        adjacent_consume_battery[1:] = self.adjacent_distance*vehicle.battery_cost_speed
+        adjacent_consume_battery[1:] = self.model.consume_battery[self.visit_index[:-1], self.visit_index[1:]]
         arrive_consume_battery = np.cumsum(adjacent_consume_battery)
         self.arrive_remain_battery = vehicle.max_battery-arrive_consume_battery
         for i in self.rechargers:
             self.arrive_remain_battery[i+1:] += vehicle.max_battery-self.arrive_remain_battery[i]
 
     def cal_remain_battery_consider_weight(self, vehicle: Vehicle) -> None:
+        '''
+        边的耗电量为Model.consume_battery+Model.consume_rate*离开起点时的载货量
+        '''
         if self.adjacent_distance is None:
             self.cal_adjacent_distance()
         if self.rechargers is None:
             self.find_charge_station()
         if self.arrive_load_weight is None:
             self.cal_load_weight(vehicle)
+        if kernel.enabled:
+            self.arrive_remain_battery = kernel.remain_battery_weight(self.visit_index, self.arrive_load_weight, self.model.consume_battery, self.model.consume_rate, self.rechargers, vehicle.max_battery)
+            return
+        start = self.visit_index[:-1]
+        end = self.visit_index[1:]
         adjacent_consume_battery = np.zeros(len(self.visit))
-        adjacent_consume_battery[1:] = (self.arrive_load_weight[:-1]+vehicle.net_weight)*self.adjacent_distance*vehicle.battery_cost_speed
+        adjacent_consume_battery[1:] = self.model.consume_battery[start, end]+self.model.consume_rate[start, end]*self.arrive_load_weight[:-1]
         arrive_consume_battery = np.cumsum(adjacent_consume_battery)
         self.arrive_remain_battery = vehicle.max_battery-arrive_consume_battery
         for i in self.rechargers:
             self.arrive_remain_battery[i+1:] += vehicle.max_battery-self.arrive_remain_battery[i]
 
-    cal_remain_battery = cal_remain_battery_without_consider_weight
+    def cal_remain_battery(self, vehicle: Vehicle) -> None:
+        # 按Model.energy_model选择，耗电与载货量无关时不需要载货量
+        if self.model.consume_rate is None:
+            self.cal_remain_battery_without_consider_weight(vehicle)
+        else:
+            self.cal_remain_battery_consider_weight(vehicle)
+
+    @staticmethod
+    def add_wait_time(arrive_time: np.ndarray, ready_time: np.ndarray) -> np.ndarray:
+        '''
+        arrive_time为不等待时的到达时间，原地加上之前各点早到等待造成的延后\n
+        第k点的延后量为max(0, max_{i<k}(ready_time[i]-arrive_time[i]))，一次前缀最大值即可，到达时间本身不含该点的等待\n
+        与原来逐个等待点平移后缀的写法只在舍入上不同，相对误差在几个ulp内(tests/test_wait_time.py按rtol=1e-12比较)，
+        到达时间恰好等于时间窗边界时两种写法的判断可能不同；kernel与这里逐位一致
+        '''
+        if len(arrive_time) > 1:
+            delay = np.maximum.accumulate(ready_time[:-1]-arrive_time[:-1])
+            if delay[-1] > 0:
+                np.maximum(delay, 0, out=delay)
+                arrive_time[1:] += delay
+        return arrive_time
 
     def cal_arrive_time(self, vehicle: Vehicle) -> None:
-        if self.adjacent_distance is None:
-            self.cal_adjacent_distance()
-        ready_time = np.array([node.ready_time for node in self.visit])
-        service_time = np.array([node.service_time for node in self.visit])
+        if self.visit_index is None:
+            self.find_visit_index()
         if self.rechargers is None:
             self.find_charge_station()
-        if len(self.rechargers != 0):
+        if len(self.rechargers) != 0:
             self.cal_remain_battery(vehicle)
-            for i in self.rechargers:
-                service_time[i] += (vehicle.max_battery-self.arrive_remain_battery[i])*vehicle.charge_speed
+        if kernel.enabled:
+            arrive_time = np.zeros(len(self.visit_index))
+            remain_battery = self.arrive_remain_battery if len(self.rechargers) != 0 else arrive_time
+            kernel.arrive_time(self.visit_index, 0, arrive_time, self.model.travel_time, self.model.service_time, self.model.ready_time, self.rechargers, remain_battery, vehicle.max_battery, vehicle.charge_speed)
+            self.arrive_time = arrive_time
+            return
+        ready_time = self.model.ready_time[self.visit_index]
+        service_time = self.model.service_time[self.visit_index]
+        for i in self.rechargers:
+            service_time[i] += (vehicle.max_battery-self.arrive_remain_battery[i])*vehicle.charge_speed
         arrive_service_time = np.cumsum(service_time)
         arrive_before_service_time = np.zeros(len(self.visit))
         arrive_before_service_time[1:] = arrive_service_time[:-1]
         adjacent_consume_time = np.zeros(len(self.visit))
-        adjacent_consume_time[1:] = self.adjacent_distance/vehicle.velocity
+        adjacent_consume_time[1:] = self.model.travel_time[self.visit_index[:-1], self.visit_index[1:]]
         arrive_consume_time = np.cumsum(adjacent_consume_time)
         arrive_time = arrive_consume_time + arrive_before_service_time
-
-        done = 0
-        while True:
-            need_process = np.where(arrive_time < ready_time)[0]
-            if len(need_process) == done:
-                break
-            i = need_process[done]
-            arrive_time[i+1:] += ready_time[i]-arrive_time[i]
-            done += 1
-        # while True in (arrive_time < ready_time):
-        #    i = np.where(arrive_time < ready_time)[0][0]
-        #    arrive_time[i:] += ready_time[i]-arrive_time[i]
-        self.arrive_time = arrive_time
+        self.arrive_time = Route.add_wait_time(arrive_time, ready_time)
 
     def cal_arrive_time_after_index(self, vehicle: Vehicle, index: int) -> None:
         '''
-        需要保证index点到达时间正确
+        需要保证index点到达时间正确\n
+        arrive_time可能与copy出的路径共用，先换成副本再写后缀
         '''
-        ready_time = np.array([node.ready_time for node in self.visit[index:]])
-        service_time = np.array([node.service_time for node in self.visit[index:]])
+        self.arrive_time = self.arrive_time.copy()
+        if kernel.enabled:
+            remain_battery = self.arrive_remain_battery if len(self.rechargers) != 0 else self.arrive_time
+            kernel.arrive_time(self.visit_index, index, self.arrive_time, self.model.travel_time, self.model.service_time, self.model.ready_time, self.rechargers, remain_battery, vehicle.max_battery, vehicle.charge_speed)
+            return
+        ready_time = self.model.ready_time[self.visit_index[index:]]
+        service_time = self.model.service_time[self.visit_index[index:]]
         for i in np.extract(self.rechargers >= index, self.rechargers):
             i = int(i)
             service_time[i-index] += (vehicle.max_battery-self.arrive_remain_battery[i])*vehicle.charge_speed
@@ -227,22 +378,10 @@ class Route:
         arrive_before_service_time[:] = self.arrive_time[index]
         arrive_before_service_time[1:] += arrive_service_time[:-1]
         adjacent_consume_time = np.zeros(len(self.visit)-index)
-        adjacent_consume_time[1:] = self.adjacent_distance[index:]/vehicle.velocity
+        adjacent_consume_time[1:] = self.model.travel_time[self.visit_index[index:-1], self.visit_index[index+1:]]
         arrive_consume_time = np.cumsum(adjacent_consume_time)
         arrive_time = arrive_consume_time + arrive_before_service_time
-
-        done = 0
-        while True:
-            need_process = np.where(arrive_time < ready_time)[0]
-            if len(need_process) == done:
-                break
-            i = need_process[done]
-            arrive_time[i+1:] += ready_time[i]-arrive_time[i]
-            done += 1
-        # while True in (arrive_time < ready_time):
-        #    i = np.where(arrive_time < ready_time)[0][0]
-        #    arrive_time[i:] += ready_time[i]-arrive_time[i]
-        self.arrive_time[index:] = arrive_time
+        self.arrive_time[index:] = Route.add_wait_time(arrive_time, ready_time)
 
     def feasible_capacity(self, vehicle: Vehicle) -> tuple:
         if self.arrive_load_weight is None:
@@ -263,20 +402,86 @@ class Route:
     def feasible_time(self, vehicle: Vehicle) -> tuple:
         if self.arrive_time is None:
             self.cal_arrive_time(vehicle)
-        over_time = np.array([node.over_time for node in self.visit])
+        if self.visit_index is None:
+            self.find_visit_index()
+        over_time = self.model.over_time[self.visit_index]
         if True in (self.arrive_time > over_time):
             return False, np.where(self.arrive_time > over_time)[0][0]
         else:
             return True, None
 
+    def cal_penalty(self, vehicle: Vehicle, early_exit: bool = False) -> tuple:
+        '''
+        一次得到(距离, 超载量, 迟到时间, 缺电量, 第一个违反的约束)，违反的约束为(类型, 位置)，可行时为None\n
+        超载量只计起点和卸货点，迟到时间为第一个迟到点的迟到量，与VNS_TS.penalty_*相同\n
+        违反的约束按容量、时间、电量的顺序找，early_exit时前四项为None，超载时不再计算到达时间和电量\n
+        完整的结果保存在cost中，路径修改前再次调用直接返回
+        '''
+        if self.cost is not None:
+            if early_exit:
+                return None, None, None, None, self.cost[4]
+            return self.cost
+        if self.visit_index is None:
+            self.find_visit_index()
+        if self.arrive_load_weight is None:
+            self.cal_load_weight(vehicle)
+        if early_exit:
+            if kernel.enabled:
+                over = kernel.first_over(self.arrive_load_weight, vehicle.capacity)
+            else:
+                over = next((k for k, weight in enumerate(self.arrive_load_weight.tolist()) if weight > vehicle.capacity), -1)
+            if over >= 0:
+                return None, None, None, None, ('capacity', over)
+        if self.arrive_time is None:
+            self.cal_arrive_time(vehicle)
+        if self.arrive_remain_battery is None:
+            self.cal_remain_battery(vehicle)
+        if kernel.enabled:
+            over, capacity, late, time, lack, battery = kernel.penalty(self.visit_index, self.arrive_load_weight, self.arrive_time, self.arrive_remain_battery, self.model.over_time, self.model.demand, vehicle.capacity)
+        else:
+            over, capacity, late, time, lack, battery = self.scan_penalty(vehicle)
+        if over >= 0:
+            violation = ('capacity', over)
+        elif late >= 0:
+            violation = ('time', late)
+        elif lack >= 0:
+            violation = ('battery', lack)
+        else:
+            violation = None
+        if early_exit:
+            return None, None, None, None, violation
+        self.cost = self.sum_distance(), capacity, time, battery, violation
+        return self.cost
+
+    def scan_penalty(self, vehicle: Vehicle) -> tuple:
+        '''
+        cal_penalty的numpy后端，结果同kernel.penalty，路径通常很短，逐点遍历列表比多次调用numpy快
+        '''
+        load = self.arrive_load_weight.tolist()
+        over = [k for k, weight in enumerate(load) if weight > vehicle.capacity]
+        capacity = max(load[0]-vehicle.capacity, 0)
+        if len(over) != 0:
+            demand = self.model.demand[self.visit_index].tolist()
+            for k in over:
+                if demand[k] < 0:
+                    capacity += load[k]-vehicle.capacity
+        late = -1
+        time = 0.0
+        for k, (arrive, over_time) in enumerate(zip(self.arrive_time.tolist(), self.model.over_time[self.visit_index].tolist())):
+            if arrive > over_time:
+                late = k
+                time = arrive-over_time
+                break
+        remain_battery = self.arrive_remain_battery
+        lack = next((k for k, battery in enumerate(remain_battery.tolist()) if battery < 0), -1)
+        battery = np.abs(remain_battery.sum(where=remain_battery < 0)) if lack >= 0 else 0.0
+        return over[0] if len(over) != 0 else -1, capacity, late, time, lack, battery
+
     def feasible(self, vehicle: Vehicle) -> tuple:
-        if not self.feasible_capacity(vehicle)[0]:
-            return False, 'capacity', self.feasible_capacity(vehicle)[1]
-        if not self.feasible_time(vehicle)[0]:
-            return False, 'time', self.feasible_time(vehicle)[1]
-        if not self.feasible_battery(vehicle)[0]:
-            return False, 'battery', self.feasible_battery(vehicle)[1]
-        return True, '', None
+        violation = self.cal_penalty(vehicle, early_exit=True)[4]
+        if violation is None:
+            return True, '', None
+        return False, violation[0], violation[1]
 
     def abandoned_feasible(self, vehicle: Vehicle) -> tuple:
         if self.arrive_load_weight is None:
@@ -291,7 +496,7 @@ class Route:
             if next_loaded_weight > vehicle.capacity:  # 检查容量限制
                 return False, (loc_index, 'capacity', loaded_weight)
 
-            distance = self.visit[loc_index].distance_to(dest)
+            distance = self.model.distance[self.visit[loc_index].index, dest.index]
             next_remain_battery = remain_battery-(vehicle.battery_cost_speed*distance*(loaded_weight+vehicle.net_weight))
             if next_remain_battery < 0:  # 检查电池限制
                 return False, (loc_index, 'battery', remain_battery)
@@ -319,6 +524,14 @@ class Route:
         self.arrive_time = None
         self.adjacent_distance = None
         self.rechargers = None
+        self.visit_index = None
+        self.visit_kind = None
+        self.position = None
+        self.fingerprint = None
+        self.cost = None
+        self.useless = None
+        self.customers = None
+        self.summary = None
 
     def random_segment_range(self, max: int) -> tuple:
         if len(self.visit) == 2:
@@ -330,131 +543,104 @@ class Route:
         return (start_point, end_point)
 
     def avg_distance(self) -> float:
-        cus_num = 0
-        for cus in self.visit:
-            if isinstance(cus, Customer):
-                cus_num += 1
-        return self.sum_distance()/cus_num
+        return self.sum_distance()/self.customer_num()
 
     def no_customer(self) -> bool:
-        if len(self.visit) == 2:
-            return True
-        else:
-            for node in self.visit[1:-1]:
-                if isinstance(node, Customer):
-                    return False
-            return True
+        return self.customer_num() == 0
 
     def remove_successive_recharger(self, vehicle: Vehicle) -> None:
+        if self.visit_index is None:
+            self.find_visit_index()
         i = 1
         while i < len(self.visit)-1:
-            if isinstance(self.visit[i], Recharger) and isinstance(self.visit[i-1], Recharger) and self.visit[i].id == self.visit[i-1].id:
+            if self.visit_kind[i] == Recharger.kind and self.visit_index[i] == self.visit_index[i-1]:
                 #del self.visit[i]
                 self.del_node(vehicle, i)
             i += 1
 
+    def has_useless_recharger(self) -> bool:
+        '''
+        remove_depot_to_recharger0或remove_successive_recharger是否会删除点，结果保存在useless中
+        '''
+        if self.useless is None:
+            if self.visit_index is None:
+                self.find_visit_index()
+            depot = self.visit[0]
+            self.useless = False
+            for where in (1, -2):
+                if self.visit_kind[where] == Recharger.kind and self.visit[where].x == depot.x and self.visit[where].y == depot.y:
+                    self.useless = True
+            if not self.useless:
+                self.useless = bool(np.any((self.visit_kind[1:-1] == Recharger.kind) & (self.visit_index[1:-1] == self.visit_index[:-2])))
+        return self.useless
+
     def remove_depot_to_recharger0(self, vehicle: Vehicle) -> None:
-        while isinstance(self.visit[1], Recharger) and self.visit[1].x == self.visit[0].x and self.visit[1].y == self.visit[0].y:
+        if self.visit_index is None:
+            self.find_visit_index()
+        while self.visit_kind[1] == Recharger.kind and self.visit[1].x == self.visit[0].x and self.visit[1].y == self.visit[0].y:
             #del self.visit[1]
             self.del_node(vehicle, 1)
-        while isinstance(self.visit[-2], Recharger) and self.visit[-2].x == self.visit[0].x and self.visit[-2].y == self.visit[0].y:
+        while self.visit_kind[-2] == Recharger.kind and self.visit[-2].x == self.visit[0].x and self.visit[-2].y == self.visit[0].y:
             #del self.visit[-2]
             self.del_node(vehicle, len(self.visit)-2)
 
+    def update_status(self, vehicle: Vehicle, start: int, removed: int, inserted: list) -> None:
+        '''
+        visit[start:start+removed]已经换成了inserted，更新已经计算过的状态\n
+        耗电与载货量无关时start之前的到达时间和电量不变，到达时间只从start-1开始重新计算\n
+        耗电与载货量有关时start之前各边的载货量也会变，第一个充电站起的充电时间随之改变，到达时间从第一个充电站开始重新计算
+        '''
+        self.position = None
+        self.cost = None
+        self.useless = None
+        self.customers = None
+        self.summary = None
+        if self.visit_index is None or start < 1:
+            self.clear_status()
+            return
+        model = self.model
+        delta = len(inserted)-removed
+        inserted_index = np.array([node.index for node in inserted], dtype=int)
+        inserted_kind = model.kind[inserted_index]
+        visit_index = np.concatenate((self.visit_index[:start], inserted_index, self.visit_index[start+removed:]))
+        visit_kind = np.concatenate((self.visit_kind[:start], inserted_kind, self.visit_kind[start+removed:]))
+        if self.fingerprint is not None:
+            low = start-1
+            high = min(start+len(inserted), len(visit_index)-1)
+            removed_hash = model.arc_hash[self.visit_index[low:high-delta], self.visit_index[low+1:high-delta+1]].sum()
+            inserted_hash = model.arc_hash[visit_index[low:high], visit_index[low+1:high+1]].sum()
+            self.fingerprint = (self.fingerprint-int(removed_hash)+int(inserted_hash)) & 0xFFFFFFFFFFFFFFFF
+        self.visit_index = visit_index
+        self.visit_kind = visit_kind
+        if self.adjacent_distance is not None:
+            low = start-1
+            high = min(start+len(inserted), len(self.visit)-1)
+            self.adjacent_distance = np.concatenate((self.adjacent_distance[:low], model.distance[self.visit_index[low:high], self.visit_index[low+1:high+1]], self.adjacent_distance[high-delta:]))
+        if self.rechargers is None and (self.arrive_remain_battery is not None or self.arrive_time is not None):
+            self.find_charge_station()
+        elif self.rechargers is not None:
+            new_rechargers = start+np.flatnonzero(inserted_kind == Recharger.kind)
+            self.rechargers = np.concatenate((self.rechargers[self.rechargers < start], new_rechargers, self.rechargers[self.rechargers >= start+removed]+delta))
+        if self.arrive_load_weight is not None:
+            self.cal_load_weight(vehicle)
+        if self.arrive_remain_battery is not None or self.arrive_time is not None:
+            self.cal_remain_battery(vehicle)
+        if self.arrive_time is not None:
+            self.arrive_time = np.concatenate((self.arrive_time[:start], np.zeros(len(inserted)), self.arrive_time[start+removed:]))
+            index = start-1
+            if model.consume_rate is not None and len(self.rechargers) != 0:
+                index = min(index, int(self.rechargers[0]))
+            self.cal_arrive_time_after_index(vehicle, index)
+
     def add_node(self, vehicle: Vehicle, i: int, node: Node) -> None:
         '''
         在i之前插入点
         '''
         i = int(i)
         assert 1 <= i and i <= len(self.visit)-1
-        # 插入访问节点
+        assert not self.shared
         self.visit.insert(i, node)
-        self.clear_status()
-        return
-
-        # 更新两点距离
-        self.adjacent_distance[i-1] = node.distance_to(self.visit[i-1])
-        new_distance = node.distance_to(self.visit[i+1])
-        self.adjacent_distance = np.insert(self.adjacent_distance, i, new_distance)
-
-        if isinstance(node, Customer):
-            # 更新载重
-            if node.demand >= 0:
-                new_node_load_weight = self.arrive_load_weight[i-1]
-                self.arrive_load_weight[:i] += node.demand
-            else:
-                new_node_load_weight = self.arrive_load_weight[i-1]-node.demand
-                self.arrive_load_weight[i] -= node.demand
-            self.arrive_load_weight = np.insert(self.arrive_load_weight, i, new_node_load_weight)
-
-            # 更新电量
-            first_cost_battery = vehicle.battery_cost_speed*self.adjacent_distance[i-1]
-            second_cost_battery = vehicle.battery_cost_speed*self.adjacent_distance[i]
-            if isinstance(self.visit[i-1], Recharger):
-                new_node_arrive_battery = vehicle.max_battery-first_cost_battery
-            else:
-                new_node_arrive_battery = self.arrive_remain_battery[i-1]-first_cost_battery
-            new_node_next_arrive_battery = new_node_arrive_battery-second_cost_battery
-            difference = new_node_next_arrive_battery-self.arrive_remain_battery[i]
-            next_station = np.extract(self.rechargers >= i, self.rechargers)
-            if len(next_station) == 0:
-                self.arrive_remain_battery[i:] += difference
-            else:
-                self.arrive_remain_battery[i:int(next_station[0])+1] += difference
-            self.arrive_remain_battery = np.insert(self.arrive_remain_battery, i, new_node_arrive_battery)
-
-            # 更新电站位置
-            self.rechargers[np.where(self.rechargers >= i)] += 1
-
-        elif isinstance(node, Recharger):
-            # 更新载重
-            new_node_load_weight = self.arrive_load_weight[i-1]
-            self.arrive_load_weight = np.insert(self.arrive_load_weight, i, new_node_load_weight)
-
-            # 更新电量
-            first_cost_battery = vehicle.battery_cost_speed*self.adjacent_distance[i-1]
-            second_cost_battery = vehicle.battery_cost_speed*self.adjacent_distance[i]
-            if isinstance(self.visit[i-1], Recharger):
-                new_node_arrive_battery = vehicle.max_battery-first_cost_battery
-            else:
-                new_node_arrive_battery = self.arrive_remain_battery[i-1]-first_cost_battery
-            new_node_next_arrive_battery = vehicle.max_battery-second_cost_battery
-            difference = new_node_next_arrive_battery-self.arrive_remain_battery[i]
-            next_station = np.extract(self.rechargers >= i, self.rechargers)
-            if len(next_station) == 0:
-                self.arrive_remain_battery[i:] += difference
-            else:
-                self.arrive_remain_battery[i:int(next_station[0])+1] += difference
-            self.arrive_remain_battery = np.insert(self.arrive_remain_battery, i, new_node_arrive_battery)
-
-            # 更新电站位置
-            self.rechargers[np.where(self.rechargers >= i)] += 1
-            insert_places = np.where(self.rechargers < i)[0]
-            if len(insert_places) != 0:
-                insert_place = insert_places[-1]+1
-            else:
-                insert_place = 0
-            self.rechargers = np.insert(self.rechargers, insert_place, i)
-
-        else:
-            raise Exception('impossible')
-
-        # 插入正确到达时间
-        travel_time = self.adjacent_distance[i-1]/vehicle.velocity
-        if isinstance(self.visit[i-1], Recharger):
-            travel_time_with_service = travel_time + vehicle.charge_speed*(vehicle.max_battery-self.arrive_remain_battery[i-1])
-            new_node_arrive_time = self.arrive_time[i-1]+travel_time_with_service
-        else:
-            travel_time_with_service = travel_time + self.visit[i-1].service_time
-            if self.arrive_time[i-1] >= self.visit[i-1].ready_time:
-                new_node_arrive_time = self.arrive_time[i-1]+travel_time_with_service
-            else:
-                new_node_arrive_time = self.visit[i-1].ready_time+travel_time_with_service
-        self.arrive_time = np.insert(self.arrive_time, i, new_node_arrive_time)
-
-        # 更新之后的到达时间
-        self.cal_arrive_time_after_index(vehicle, i)
-        # self.cal_arrive_time(vehicle)
+        self.update_status(vehicle, i, 0, [node])
 
     def del_node(self, vehicle: Vehicle, i: int) -> None:
         '''
@@ -462,78 +648,196 @@ class Route:
         '''
         i = int(i)
         assert 1 <= i and i <= len(self.visit)-1
+        assert not self.shared
         del self.visit[i]
-        self.clear_status()
-        return
-
-        # 删除相邻距离
-        self.adjacent_distance = np.delete(self.adjacent_distance, i)
-        self.adjacent_distance[i-1] = self.visit[i-1].distance_to(self.visit[i+1])
-
-        if isinstance(self.visit[i], Customer):
-            # 更新载重
-            if self.visit[i].demand >= 0:
-                self.arrive_load_weight[:i] -= self.visit[i].demand
-            else:
-                self.arrive_load_weight[i:] += self.visit[i].demand
-            self.arrive_load_weight = np.delete(self.arrive_load_weight, i)
-
-        elif isinstance(self.visit[i], Recharger):
-            # 更新载重
-            self.arrive_load_weight = np.delete(self.arrive_load_weight, i)
-            # 更新电站位置
-            self.rechargers = np.delete(self.rechargers, np.where(self.rechargers == i))
-
-        else:
-            raise Exception('impossible')
-
-        # 更新电量
-        self.arrive_remain_battery = np.delete(self.arrive_remain_battery, i)
-        if isinstance(self.visit[i-1], Recharger):
-            i_next_battery = vehicle.max_battery-self.adjacent_distance[i-1]*vehicle.battery_cost_speed
-        else:
-            i_next_battery = self.arrive_remain_battery[i-1]-self.adjacent_distance[i-1]*vehicle.battery_cost_speed
-        difference = i_next_battery-self.arrive_remain_battery[i]
-        next_station = np.extract(self.rechargers > i, self.rechargers)
-        if len(next_station) == 0:
-            self.arrive_remain_battery[i:] += difference
-        else:
-            self.arrive_remain_battery[i:int(next_station[0])+1] += difference
-
-        # 更新电站位置
-        self.rechargers[np.where(self.rechargers > i)] -= 1
-
-        # 删除访问节点
-        del self.visit[i]
-
-        # 更新之后的到达时间
-        self.arrive_time = np.delete(self.arrive_time, i)
-        self.cal_arrive_time_after_index(vehicle, i-1)
-        # self.cal_arrive_time(vehicle)
+        self.update_status(vehicle, i, 1, [])
 
     def replace_node(self, vehicle: Vehicle, i: int, node: Node) -> None:
         i = int(i)
         assert 1 <= i and i <= len(self.visit)-1
+        assert not self.shared
         self.visit[i] = node
-        self.clear_status()
+        self.update_status(vehicle, i, 1, [node])
 
     def add_nodes(self, vehicle: Vehicle, i: int, node_list: list) -> None:
         assert 1 <= i and i <= len(self.visit)-1
+        assert not self.shared
         i = int(i)
+        node_list = list(node_list)
         self.visit = self.visit[:i]+node_list+self.visit[i:]
-        self.clear_status()
+        self.update_status(vehicle, i, 0, node_list)
 
     def del_nodes(self, vehicle: Vehicle, start: int, end: int) -> None:
+        assert not self.shared
         start = int(start)
         end = int(end)
+        removed = len(self.visit[start:end])
         del self.visit[start:end]
-        self.clear_status()
+        self.update_status(vehicle, start, removed, [])
 
     def replace_nodes(self, vehicle: Vehicle, start: int, end: int, node_list: list) -> None:
+        assert not self.shared
         start = int(start)
         end = int(end)
+        node_list = list(node_list)
+        removed = len(self.visit[start:end])
         self.visit[start:end] = node_list
-        self.clear_status()
+        self.update_status(vehicle, start, removed, node_list)
+
+
+class RouteBatch:
+    '''
+    一次计算多条候选路径的状态与惩罚，长度相同的路径排成一个二维索引数组，每种长度只需几次numpy运算\n
+    不用补齐到同一长度，numpy按行求和时与一维求和的分块相同，结果与逐条Route.cal_penalty完全一致\n
+    访问序列相同的路径只计算一次
+    '''
+    # 构造属性
+    routes = []
+    model = None
+    # 计算属性
+    distance = None  # 以下按routes顺序 向量
+    capacity = None  # 超载量
+    time = None  # 迟到时间
+    battery = None  # 缺电量
+    violation = None  # 第一个违反的约束 0可行 1容量 2时间 3电量
+    position = None  # 第一个违反约束的位置 可行时为-1
+    customer_num = None
+    fingerprint = None  # 同Route.fingerprint 向量
+
+    def __init__(self, routes: list, model: object) -> None:
+        self.routes = routes
+        self.model = model
+
+    def evaluate(self, vehicle: Vehicle) -> None:
+        unique = {}  # 访问序列到在unique_index中的位置
+        unique_index = []
+        where = np.empty(len(self.routes), dtype=int)
+        for i, route in enumerate(self.routes):
+            if route.visit_index is None:
+                route.find_visit_index()
+            where[i] = unique.setdefault(route.visit_index.tobytes(), len(unique))
+            if where[i] == len(unique_index):
+                unique_index.append(route.visit_index)
+        if self.model.arc_hash is None:
+            self.model.cal_arc_hash()
+        value = np.empty((7, len(unique_index)))
+        fingerprint = np.empty(len(unique_index), dtype=np.uint64)
+        group = {}
+        for i, visit_index in enumerate(unique_index):
+            group.setdefault(len(visit_index), []).append(i)
+        for rows in group.values():
+            ret = self.cal_group(vehicle, np.array([unique_index[i] for i in rows]))
+            value[:, rows] = ret[:-1]
+            fingerprint[rows] = ret[-1]
+        self.distance, self.capacity, self.time, self.battery, violation, position, customer_num = value[:, where]
+        self.fingerprint = fingerprint[where]
+        self.violation = violation.astype(int)
+        self.position = position.astype(int)
+        self.customer_num = customer_num.astype(int)
+
+    def cal_group(self, vehicle: Vehicle, visit_index: np.ndarray) -> tuple:
+        '''
+        visit_index每行一条路径，各步与Route中numpy实现的运算顺序相同
+        '''
+        model = self.model
+        num, n = visit_index.shape
+        start = visit_index[:, :-1]
+        end = visit_index[:, 1:]
+        kind = model.kind[visit_index]
+        is_recharger = kind == Recharger.kind
+        distance = model.distance[start, end].sum(axis=1)
+        # 载货量
+        demand = model.demand[visit_index]
+        load_weight = np.sum(demand, axis=1, where=demand > 0)[:, None]-np.cumsum(demand, axis=1)
+        # 电量，第k个充电站对所有行一起处理
+        adjacent_consume_battery = np.zeros((num, n))
+        adjacent_consume_battery[:, 1:] = model.consume_battery[start, end]
+        if model.consume_rate is not None:
+            adjacent_consume_battery[:, 1:] += model.consume_rate[start, end]*load_weight[:, :-1]
+        remain_battery = vehicle.max_battery-np.cumsum(adjacent_consume_battery, axis=1)
+        column = np.arange(n)
+        recharger_rank = np.cumsum(is_recharger, axis=1)
+        for k in range(1, int(recharger_rank[:, -1].max())+1):
+            row, col = np.nonzero(is_recharger & (recharger_rank == k))
+            charge = vehicle.max_battery-remain_battery[row, col]
+            remain_battery[row] += np.where(column > col[:, None], charge[:, None], 0.0)
+        # 到达时间
+        service_time = model.service_time[visit_index]
+        service_time[is_recharger] += (vehicle.max_battery-remain_battery[is_recharger])*vehicle.charge_speed
+        arrive_before_service_time = np.zeros((num, n))
+        arrive_before_service_time[:, 1:] = np.cumsum(service_time, axis=1)[:, :-1]
+        adjacent_consume_time = np.zeros((num, n))
+        adjacent_consume_time[:, 1:] = model.travel_time[start, end]
+        arrive_time = np.cumsum(adjacent_consume_time, axis=1)+arrive_before_service_time
+        if n > 1:
+            delay = np.maximum.accumulate(model.ready_time[start]-arrive_time[:, :-1], axis=1)
+            arrive_time[:, 1:] += np.maximum(delay, 0)
+        # 惩罚，同Route.scan_penalty
+        over = load_weight > vehicle.capacity
+        over_weight = np.zeros((num, n+1))
+        over_weight[:, 0] = np.maximum(load_weight[:, 0]-vehicle.capacity, 0)
+        over_weight[:, 1:] = np.where(over & (demand < 0), load_weight-vehicle.capacity, 0.0)
+        capacity = np.cumsum(over_weight, axis=1)[:, -1]
+        over_time = model.over_time[visit_index]
+        late = arrive_time > over_time
+        lack = remain_battery < 0
+        battery = np.abs(np.sum(remain_battery, axis=1, where=lack))
+        # 按电量、时间、容量的顺序覆盖，留下的是最先检查的约束
+        row = np.arange(num)
+        violation = np.zeros(num)
+        position = np.full(num, -1.0)
+        for code, mask in ((3, lack), (2, late), (1, over)):
+            first = np.argmax(mask, axis=1)
+            found = mask[row, first]
+            violation[found] = code
+            position[found] = first[found]
+            if code == 2:
+                time = np.where(found, arrive_time[row, first]-over_time[row, first], 0.0)
+        return distance, capacity, time, battery, violation, position, np.count_nonzero(kind == Customer.kind, axis=1), model.arc_hash[start, end].sum(axis=1)
+
+    def objective(self, penalty: list, skip_empty: bool = False) -> np.ndarray:
+        '''
+        同get_objective_route，skip_empty时没有客户的路径为0
+        '''
+        ret = self.distance+penalty[0]*self.capacity+penalty[1]*self.time+penalty[2]*self.battery
+        if skip_empty:
+            ret[self.customer_num == 0] = 0
+        return ret
+
+    def feasible(self) -> np.ndarray:
+        return self.violation == 0
+
+    def save_cost(self) -> None:
+        '''
+        把结果按cal_penalty的格式存入各路径的cost
+        '''
+        name = (None, 'capacity', 'time', 'battery')
+        violation = self.violation.tolist()
+        position = self.position.tolist()
+        customer_num = self.customer_num.tolist()
+        fingerprint = self.fingerprint.tolist()
+        for i, route in enumerate(self.routes):
+            route.cost = (self.distance[i], self.capacity[i], self.time[i], self.battery[i], None if violation[i] == 0 else (name[violation[i]], position[i]))
+            route.customers = customer_num[i]
+            route.fingerprint = fingerprint[i]
+
+    @staticmethod
+    def evaluate_solutions(solutions: list, model: object, penalty: list, skip_empty: bool = False) -> tuple:
+        '''
+        返回各解的(目标值, 是否可行)列表，目标值同Solution.get_objective\n
+        只计算cost为None的路径，计算结果存入路径
+        '''
+        routes = [route for solution in solutions for route in solution.routes if route.cost is None]
+        if len(routes) != 0:
+            batch = RouteBatch(routes, model)
+            batch.evaluate(model.vehicle)
+            batch.save_cost()
+        objective = []
+        feasible = []
+        for solution in solutions:
+            objective.append(float(solution.get_objective(model, penalty, skip_empty)))
+            feasible.append(all(route.cost[4] is None for route in solution.routes))
+        return objective, feasible
 
 
 class Model:
@@ -547,7 +851,39 @@ class Model:
     customers = []
     rechargers = []
     # 计算属性
-    nearest_station = {}
+    nodes = []  # 仓库、充电站、客户依次排列
+    customer_index = {}  # 客户id到nodes索引
+    recharger_index = {}  # 充电站id到nodes索引
+    x = None  # 以下按nodes索引的属性 向量
+    y = None
+    demand = None
+    ready_time = None
+    over_time = None
+    service_time = None
+    kind = None
+    distance = None  # 两点距离 矩阵
+    travel_time = None  # 两点行驶时间 矩阵
+    consume_battery = None  # 两点耗电量 矩阵 耗电与载货量有关时为空载耗电量
+    consume_rate = None  # 每单位载货量增加的耗电量 矩阵 耗电与载货量无关时为None
+    station_grid = None  # 充电站空间索引 序号为在rechargers中的位置
+    depot_station = ()  # 与仓库重合的充电站在rechargers中的位置
+    nearest_station = {}  # 节点到最近的几个充电站 字典
+    nearest_station_num = 3
+    station_table = None  # 在两点之间插入时绕路最少的几个充电站的nodes索引 不足用-1补齐 矩阵
+    station_table_num = 3
+    useful_station = []  # 至少对一条边是候选的充电站，其余的对所有边都被支配
+    early_time = None  # 考虑从仓库出发后最早开始服务的时刻 向量
+    late_time = None  # 考虑返回仓库后最晚到达的时刻 向量
+    arc_feasible = None  # 两点能否在可行路径中相邻 矩阵
+    arc_indptr = None  # 禁忌搜索用的可行边 按起点压缩存储 第i个点的出边为arc_indices[arc_indptr[i]:arc_indptr[i+1]]
+    arc_indices = None  # 可行边终点的nodes索引 向量
+    arc_weight = None  # 可行边长度 向量
+    arc_hash = None  # 每条边的Zobrist随机数 用于路径和解的指纹 矩阵
+    energy_model = 'linear'  # 耗电模型 'linear'耗电只与距离有关 'load'还与载货量有关 也可以是函数f(model)->(consume_battery, consume_rate)
+    # 缓存设置
+    use_cache = True  # 读入算例时使用算例旁的.npz缓存，自定义耗电模型时不使用
+    cache_version = 5  # 预处理逻辑改变时递增，使旧缓存失效
+    cache_arrays = ('vehicle', 'id', 'kind', 'x', 'y', 'demand', 'ready_time', 'over_time', 'service_time', 'distance', 'nearest_station', 'arc_indptr', 'arc_indices', 'arc_weight', 'station_table')  # 缓存中除key以外的数组
 
     def __init__(self, data_file: str = '', file_type: str = '', negative_demand=0, **para) -> None:
         self.data_file = data_file
@@ -558,6 +894,10 @@ class Model:
             setattr(self, key, value)
 
     def read_data(self) -> None:
+        if callable(self.energy_model):
+            self.use_cache = False
+        if self.use_cache and self.__load_cache():
+            return
         if self.file_type in ['e', 's5', 's10', 's15']:
             self.__read_data_normal()
         elif self.file_type == 'tw':
@@ -567,9 +907,139 @@ class Model:
         else:
             raise Exception('impossible')
         self.set_negative_demand(self.negative_demand)
+        self.cal_node_array()
+        self.cal_matrix()
+        self.cal_station_table()
+        self.cal_arc_feasible()
+        if self.use_cache:
+            self.find_possible_arc()
+            self.__save_cache()
+
+    def get_cache_path(self) -> str:
+        return '{}{}.npz'.format(os.path.splitext(self.data_file)[0], '' if self.negative_demand == 0 else '_neg'+str(self.negative_demand))
+
+    def get_cache_key(self) -> str:
+        # 车辆参数由算例文件和file_type决定，所以文件哈希已经包含了车辆参数
+        with open(self.data_file, 'rb') as f:
+            file_hash = hashlib.sha1(f.read()).hexdigest()
+        return '{} {} {} {} {} {} {}'.format(file_hash, self.file_type, self.negative_demand, self.nearest_station_num, self.station_table_num, self.energy_model, self.cache_version)
+
+    def __save_cache(self) -> None:
+        nearest_station = np.full((len(self.nodes), self.nearest_station_num), -1)
+        for node, stations in self.nearest_station.items():
+            nearest_station[node.index, :len(stations)] = [station.index for station in stations]
+        vehicle = np.array([self.vehicle.capacity, self.vehicle.max_battery, self.vehicle.net_weight, self.vehicle.velocity, self.vehicle.battery_cost_speed, self.vehicle.charge_speed])
+        path = self.get_cache_path()
+        try:
+            # 每个进程写自己的临时文件再改名，多个进程同时写时不会互相覆盖，也不会读到写了一半的文件
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(path)))
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, key=self.get_cache_key(), id=np.array([node.id for node in self.nodes]), kind=self.kind, x=self.x, y=self.y, demand=self.demand, ready_time=self.ready_time, over_time=self.over_time,
+                         service_time=self.service_time, vehicle=vehicle, distance=self.distance, nearest_station=nearest_station, station_table=self.station_table,
+                         arc_indptr=self.arc_indptr, arc_indices=self.arc_indices, arc_weight=self.arc_weight)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def __load_cache(self) -> bool:
+        path = self.get_cache_path()
+        if not os.path.exists(path):
+            return False
+        # 先读出全部数组，文件损坏(截断、CRC错误、缺少数组)时当作没有缓存，重新计算
+        try:
+            with np.load(path) as npz:
+                if str(npz['key']) != self.get_cache_key():
+                    return False
+                cache = {name: npz[name] for name in self.cache_arrays}
+        except (OSError, ValueError, EOFError, KeyError, zipfile.BadZipFile):
+            return False
+        self.vehicle = Vehicle(*cache['vehicle'].tolist())
+        self.customers = []
+        self.rechargers = []
+        for id, kind, x, y, demand, ready_time, over_time, service_time in zip(*[cache[name].tolist() for name in ['id', 'kind', 'x', 'y', 'demand', 'ready_time', 'over_time', 'service_time']]):
+            if kind == Depot.kind:
+                self.depot = Depot(id, x, y, over_time)
+            elif kind == Customer.kind:
+                self.customers.append(Customer(id, x, y, demand, ready_time, over_time, service_time))
+            elif kind == Recharger.kind:
+                self.rechargers.append(Recharger(id, x, y, over_time))
+        self.cal_node_array()
+        self.distance = cache['distance']
+        self.cal_travel_matrix()
+        if len(self.rechargers) != 0:
+            self.nearest_station = {node: [self.nodes[i] for i in row if i >= 0] for node, row in zip(self.nodes, cache['nearest_station'].tolist())}
+        self.arc_indptr = cache['arc_indptr']
+        self.arc_indices = cache['arc_indices']
+        self.arc_weight = cache['arc_weight']
+        self.station_table = cache['station_table']
+        self.find_useful_station()
+        self.cal_arc_feasible()
+        return True
+
+    def cal_node_array(self) -> None:
+        self.nodes = [self.depot]+self.rechargers+self.customers
+        for index, node in enumerate(self.nodes):
+            node.index = index
+        self.customer_index = {cus.id: cus.index for cus in self.customers}
+        self.recharger_index = {rec.id: rec.index for rec in self.rechargers}
+        self.x = np.array([node.x for node in self.nodes])
+        self.y = np.array([node.y for node in self.nodes])
+        self.demand = np.array([node.demand for node in self.nodes])
+        self.ready_time = np.array([node.ready_time for node in self.nodes])
+        self.over_time = np.array([node.over_time for node in self.nodes])
+        self.service_time = np.array([node.service_time for node in self.nodes])
+        self.kind = np.array([node.kind for node in self.nodes], dtype=np.int8)
+        station_index = slice(1, len(self.rechargers)+1)
+        self.station_grid = Grid(self.x[station_index], self.y[station_index])
+        self.depot_station = tuple(np.flatnonzero((self.x[station_index] == self.depot.x) & (self.y[station_index] == self.depot.y)).tolist())
+
+    def cal_matrix(self) -> None:
+        x = self.x
+        y = self.y
+        square = (x[:, np.newaxis]-x)**2+(y[:, np.newaxis]-y)**2
+        # 与Node.distance_to一样用**0.5开方，np.sqrt的舍入与之不同
+        self.distance = np.array([value**0.5 for value in square.ravel().tolist()]).reshape(square.shape)
+        self.cal_travel_matrix()
+
+    def cal_travel_matrix(self) -> None:
+        self.travel_time = self.distance/self.vehicle.velocity
+        self.cal_energy_matrix()
+
+    def cal_energy_matrix(self) -> None:
+        '''
+        把耗电模型预先算成每条边的系数，边的耗电量为consume_battery+consume_rate*离开起点时的载货量
+        '''
+        if self.energy_model == 'linear':
+            self.consume_battery = self.distance*self.vehicle.battery_cost_speed
+            self.consume_rate = None
+        elif self.energy_model == 'load':
+            rate = self.distance*self.vehicle.battery_cost_speed
+            self.consume_battery = rate*self.vehicle.net_weight
+            self.consume_rate = rate
+        elif callable(self.energy_model):
+            self.consume_battery, self.consume_rate = self.energy_model(self)
+        else:
+            raise Exception('no this energy model')
+
+    def min_consume_battery(self) -> np.ndarray:
+        '''
+        载货量在0到容量之间时每条边耗电量的下界
+        '''
+        if self.consume_rate is None:
+            return self.consume_battery
+        return self.consume_battery+np.minimum(self.consume_rate, 0)*self.vehicle.capacity
 
     def __read_data_normal(self) -> None:
         assert len(self.data_file) != 0
+        self.vehicle = Vehicle()
+        self.customers = []
+        self.rechargers = []
         with open(self.data_file) as f:
             meet_empty_line = False
             for line in f.readlines()[1:]:
@@ -603,60 +1073,114 @@ class Model:
                         raise Exception('wrong file')
 
     def get_map_bound(self) -> tuple:
-        cus_x = [cus.x for cus in self.customers]
-        cus_y = [cus.y for cus in self.customers]
-        cus_min_x = min(cus_x)
-        cus_max_x = max(cus_x)
-        cus_min_y = min(cus_y)
-        cus_max_y = max(cus_y)
-        if len(self.rechargers) != 0:
-            rec_x = [rec.x for rec in self.rechargers]
-            rec_y = [rec.y for rec in self.rechargers]
-            rec_min_x = min(rec_x)
-            rec_max_x = max(rec_x)
-            rec_min_y = min(rec_y)
-            rec_max_y = max(rec_y)
-            min_x = min(cus_min_x, rec_min_x, self.depot.x)
-            max_x = max(cus_max_x, rec_max_x, self.depot.x)
-            min_y = min(cus_min_y, rec_min_y, self.depot.y)
-            max_y = max(cus_max_y, rec_max_y, self.depot.y)
-        else:
-            min_x = min(cus_min_x, self.depot.x)
-            max_x = max(cus_max_x, self.depot.x)
-            min_y = min(cus_min_y, self.depot.y)
-            max_y = max(cus_max_y, self.depot.y)
-        return min_x, max_x, min_y, max_y
+        return float(self.x.min()), float(self.x.max()), float(self.y.min()), float(self.y.max())
 
     def find_nearest_station(self) -> None:
         if len(self.rechargers) == 0:
             return
-        self.nearest_station = {}
-        station00 = None
-        for station in self.rechargers:
-            if station.x == self.depot.x and station.y == self.depot.y:
-                station00 = station
-                break
-        self.nearest_station[self.depot] = sorted(self.rechargers, key=lambda rec: self.depot.distance_to(rec))
-        self.nearest_station[self.depot].remove(station00)
-        for cus in self.customers:
-            self.nearest_station[cus] = sorted(self.rechargers, key=lambda rec: cus.distance_to(rec))
-        for station in self.rechargers:
-            other_staion = self.rechargers[:]
-            other_staion.remove(station)
-            other_staion.sort(key=lambda rec: station.distance_to(rec))
-            self.nearest_station[station] = other_staion
+        self.nearest_station = {node: self.find_k_nearest_station(node, self.nearest_station_num) for node in self.nodes}
+
+    def __station_exclude(self, node: Node) -> tuple:
+        # 充电站不能选自己，仓库不能选与之重合的充电站
+        if isinstance(node, Recharger):
+            return (node.index-1,)
+        elif isinstance(node, Depot):
+            return self.depot_station
+        return ()
+
+    def find_k_nearest_station(self, node: Node, k: int) -> list:
+        row = self.distance[node.index, 1:len(self.rechargers)+1]
+        return [self.rechargers[i] for i in self.station_grid.nearest(node.x, node.y, k, row, self.__station_exclude(node))]
+
+    def find_possible_arc(self) -> None:
+        self.find_nearest_station()
+        distance = self.distance
+        is_customer = self.kind == Customer.kind
+        customer_pair = is_customer[:, np.newaxis] & is_customer
+        # 与仓库重合的充电站和仓库之间的边
+        depot_station = np.zeros(len(self.nodes), dtype=bool)
+        depot_station[[i+1 for i in self.depot_station]] = True
+        possible = np.ones(distance.shape, dtype=bool)
+        possible[0, depot_station] = False
+        possible[depot_station, 0] = False
+        np.fill_diagonal(possible, False)
+        # 加法顺序与逐个判断时相同，保证边界上的舍入一致
+        possible &= ~(customer_pair & (self.demand[:, np.newaxis]+self.demand > self.vehicle.capacity))
+        leave = (self.ready_time+self.service_time)[:, np.newaxis]+distance
+        possible &= ~(leave > self.over_time)
+        possible &= ~(leave+self.service_time+distance[:, 0] > self.over_time[0])
+        if len(self.rechargers) != 0:
+            # 从最近的充电站出发经过这条边再到最近的充电站，按耗电量的下界判断
+            station_index = slice(1, len(self.rechargers)+1)
+            consume = self.min_consume_battery()
+            from_station = np.min(consume[station_index, :], axis=0)
+            to_station = np.min(consume[:, station_index], axis=1)
+            battery = from_station[:, np.newaxis]+consume+to_station
+            possible &= ~(customer_pair & (battery > self.vehicle.max_battery))
+        self.arc_indptr = np.zeros(len(self.nodes)+1, dtype=np.int64)
+        np.cumsum(np.count_nonzero(possible, axis=1), out=self.arc_indptr[1:])
+        self.arc_indices = np.nonzero(possible)[1]
+        self.arc_weight = distance[possible]
+        self.arc_weight[self.arc_weight == 0] = 0.0000001
+
+    def cal_arc_feasible(self) -> None:
+        # 用仓库出发和返回的行驶时间收紧时间窗
+        self.early_time = np.maximum(self.ready_time, self.travel_time[0])
+        self.late_time = np.minimum(self.over_time, self.over_time[0]-self.service_time-self.travel_time[:, 0])
+        feasible = (self.early_time+self.service_time)[:, np.newaxis]+self.travel_time <= self.late_time[np.newaxis, :]+1e-6
+        # 两个都送货或都取货的客户相邻时至少要装下两者之和
+        demand = self.demand
+        same_sign = ((demand[:, np.newaxis] > 0) & (demand > 0)) | ((demand[:, np.newaxis] < 0) & (demand < 0))
+        feasible &= ~(same_sign & (np.abs(demand[:, np.newaxis]+demand) > self.vehicle.capacity))
+        np.fill_diagonal(feasible, False)
+        feasible[0, 0] = True  # 空路径
+        # 充电站会被修复操作随时插入删除，与之相邻的边不作判断
+        is_station = self.kind == Recharger.kind
+        feasible[is_station, :] = True
+        feasible[:, is_station] = True
+        self.arc_feasible = feasible
+
+    def cal_arc_hash(self) -> None:
+        # 固定种子，同一算例的指纹在不同运行中相同
+        n = len(self.nodes)
+        self.arc_hash = np.random.default_rng(0).bit_generator.random_raw((n, n))
+
+    def cal_station_table(self, chunk_size: int = 1 << 20) -> None:
+        # 对所有点对按d(i,s)+d(s,j)给充电站排序，分块计算避免三维数组过大
+        n = len(self.nodes)
+        k = min(self.station_table_num, len(self.rechargers))
+        self.station_table = np.full((n, n, self.station_table_num), -1, dtype=np.int32)
+        if k == 0:
+            self.useful_station = []
+            return
+        station_index = slice(1, len(self.rechargers)+1)
+        to_station = self.distance[:, station_index].copy()
+        # 充电站不能插在自己旁边，仓库旁不能插与之重合的充电站
+        exclude = np.zeros(to_station.shape, dtype=bool)
+        exclude[np.arange(1, len(self.rechargers)+1), np.arange(len(self.rechargers))] = True
+        exclude[0, list(self.depot_station)] = True
+        step = max(1, chunk_size//(n*len(self.rechargers)))
+        for start in range(0, n, step):
+            end = min(start+step, n)
+            dis = to_station[start:end, np.newaxis, :]+to_station[np.newaxis, :, :]
+            dis[exclude[start:end, np.newaxis, :] | exclude[np.newaxis, :, :]] = float('inf')
+            order = np.argsort(dis, axis=2, kind='stable')[:, :, :k]
+            valid = np.take_along_axis(dis, order, axis=2) != float('inf')
+            self.station_table[start:end, :, :k] = np.where(valid, order+1, -1)
+        self.find_useful_station()
+
+    def find_useful_station(self) -> None:
+        useful = set(np.unique(self.station_table).tolist())
+        self.useful_station = [rec for rec in self.rechargers if rec.index in useful]
+
+    def get_station_candidates(self, node1: Node, node2: Node) -> list:
+        return [self.nodes[i] for i in self.station_table[node1.index, node2.index].tolist() if i >= 0]
 
     def find_near_station_between(self, node1: Node, node2: Node) -> Recharger:
-        min_dis = float('inf')
-        min_station = None
-        for station in self.rechargers:
-            if station == node1 or station == node2 or (isinstance(node1, Depot) and station.x == node1.x and station.y == node1.y) or (isinstance(node2, Depot) and station.x == node2.x and station.y == node2.y):
-                continue
-            dis = node1.distance_to(station)+node2.distance_to(station)
-            if dis < min_dis:
-                min_dis = dis
-                min_station = station
-        return min_station
+        i = int(self.station_table[node1.index, node2.index, 0])
+        if i < 0:
+            return None
+        return self.nodes[i]
 
     def set_negative_demand(self, every: int) -> None:
         if every == 0:
@@ -666,24 +1190,24 @@ class Model:
                 cus.demand = -cus.demand
 
     def get_customer(self, id: int) -> Customer:
-        for customer in self.customers:
-            if customer.id == id:
-                return customer
-        raise Exception('no this customer')
+        if id not in self.customer_index:
+            raise Exception('no this customer')
+        return self.nodes[self.customer_index[id]]
 
     def get_recharger(self, id: int) -> Recharger:
-        for recharger in self.rechargers:
-            if recharger.id == id:
-                return recharger
-        raise Exception('no this recharger')
+        if id not in self.recharger_index:
+            raise Exception('no this recharger')
+        return self.nodes[self.recharger_index[id]]
 
     def create_empty_route(self) -> Route:
-        ret = Route([self.depot, self.depot])
+        ret = Route([self.depot, self.depot], self)
         ret.arrive_load_weight = np.array([0.0, 0.0])  # 到达并服务后载货量 向量
         ret.arrive_remain_battery = np.array([self.vehicle.max_battery, self.vehicle.max_battery])  # 刚到达时剩余电量 向量
         ret.arrive_time = np.array([0.0, 0.0])  # 刚到达时的时刻 向量
         ret.adjacent_distance = np.array([0.0])  # 两点距离 向量
-        ret.rechargers = np.array([])  # 充电桩索引 向量
+        ret.rechargers = np.array([], dtype=int)  # 充电桩索引 向量
+        ret.visit_index = np.array([self.depot.index, self.depot.index])  # 访问节点索引 向量
+        ret.visit_kind = self.kind[ret.visit_index]  # 访问节点类型 向量
         return ret
 
     def __read_data_solomon(self):
@@ -734,7 +1258,11 @@ class Solution:
     # 状态属性
     id = []
     next_id = 0
-    objective = None
+    cost = None  # 各路径(距离, 超载量, 迟到时间, 缺电量)按路径顺序分别求和 路径改变后置为None 元组
+    customer_cost = None  # 同cost 只计有客户的路径
+    customer_position = None  # 客户在nodes中的索引到(第几条路径, 位置) 字典 路径改变后置为None
+    station_position = None  # 充电站在nodes中的索引到[(第几条路径, 位置)] 字典
+    fingerprint = None  # 与路径顺序无关的指纹 路径改变后置为None
 
     def __init__(self, routes: list) -> None:
         assert isinstance(routes[0], Route)
@@ -756,21 +1284,35 @@ class Solution:
         return len(self.routes)
 
     def __eq__(self, other: object) -> bool:
-        if len(self.routes) != len(other.routes):
+        '''
+        路径集合相同即相等，与路径顺序无关，先比较指纹，不会重排路径
+        '''
+        if len(self.routes) != len(other.routes) or self.get_fingerprint() != other.get_fingerprint():
             return False
-        self.arrange()
-        for a, b in zip(self.routes, other.routes):
-            if a != b:
-                return False
-        return True
+        key = sorted(tuple(node.key for node in route.visit) for route in self.routes)
+        return key == sorted(tuple(node.key for node in route.visit) for route in other.routes)
+
+    def __hash__(self) -> int:
+        return self.get_fingerprint()
 
     def copy(self) -> object:
-        ret = Solution([route.copy() for route in self.routes])
+        '''
+        写时复制，路径对象与原解共用，修改路径前用modify_route换成副本
+        '''
+        for route in self.routes:
+            route.shared = True
+        ret = Solution(self.routes[:])
         ret.id = self.id[:]
         ret.next_id = self.next_id
+        ret.customer_position = self.customer_position
+        ret.station_position = self.station_position
+        ret.fingerprint = self.fingerprint
+        ret.cost = self.cost
+        ret.customer_cost = self.customer_cost
         return ret
 
     def arrange(self) -> None:
+        self.clear_index()
         self.routes.sort(key=lambda route: (route.visit[1].id, route.visit[1].x, route.visit[1].y))
 
     def sum_distance(self) -> float:
@@ -810,12 +1352,33 @@ class Solution:
                 return False
         return True
 
+    def modify_route(self, index: int) -> Route:
+        '''
+        修改路径都要通过这里，与其它解共用的路径换成副本，位置索引失效
+        '''
+        self.clear_index()
+        route = self.routes[index]
+        if route.shared:
+            route = route.copy()
+            self.routes[index] = route
+        return route
+
+    def remove_useless_recharger(self, model: Model, indexes: list = None) -> None:
+        '''
+        对indexes中的路径(默认全部)执行remove_depot_to_recharger0和remove_successive_recharger，只复制确实要修改的路径
+        '''
+        for i in (range(len(self.routes)) if indexes is None else indexes):
+            if self.routes[i].has_useless_recharger():
+                route = self.modify_route(i)
+                route.remove_depot_to_recharger0(model.vehicle)
+                route.remove_successive_recharger(model.vehicle)
+
     def clear_status(self) -> None:
-        self.objective = None
-        for route in self.routes:
-            route.clear_status()
+        for i in range(len(self.routes)):
+            self.modify_route(i).clear_status()
 
     def add_empty_route(self, model: Model) -> None:
+        self.clear_index()
         self.routes.append(model.create_empty_route())
         self.id.append(self.next_id)
         self.next_id += 1
@@ -824,25 +1387,118 @@ class Solution:
         i = 0
         while i < len(self.routes):
             if self.routes[i].no_customer():
+                self.clear_index()
                 del self.routes[i]
                 del self.id[i]
                 continue
             i += 1
 
     def remove_route_index(self, index: int) -> None:
+        self.clear_index()
         del self.routes[index]
         del self.id[index]
 
     def remove_route_object(self, route: Route) -> None:
+        self.clear_index()
         index = self.routes.index(route)
         del self.routes[index]
         del self.id[index]
 
     def add_route(self, route: Route) -> None:
+        self.clear_index()
         self.routes.append(route)
         self.id.append(self.next_id)
         self.next_id += 1
 
+    def find_position(self) -> None:
+        '''
+        由各路径的位置汇总，路径共用时各自的位置也只算一次
+        '''
+        self.customer_position = {}
+        self.station_position = {}
+        for which, route in enumerate(self.routes):
+            if route.position is None:
+                route.find_position()
+            customer, station = route.position
+            for index, where in customer.items():
+                self.customer_position.setdefault(index, (which, where))
+            for index, wheres in station.items():
+                self.station_position.setdefault(index, []).extend((which, where) for where in wheres)
+
+    def clear_index(self) -> None:
+        '''
+        路径改变后位置索引和指纹失效
+        '''
+        self.customer_position = None
+        self.station_position = None
+        self.fingerprint = None
+        self.cost = None
+        self.customer_cost = None
+
+    def cal_cost(self, model: Model) -> None:
+        cost = [0, 0, 0, 0]
+        customer_cost = [0, 0, 0, 0]
+        for route in self.routes:
+            value = route.cal_penalty(model.vehicle)
+            for k in range(4):
+                cost[k] += value[k]
+            if not route.no_customer():
+                for k in range(4):
+                    customer_cost[k] += value[k]
+        self.cost = tuple(cost)
+        self.customer_cost = tuple(customer_cost)
+
+    def get_objective(self, model: Model, penalty: list, skip_empty: bool = False) -> float:
+        '''
+        只保存违反量，不保存加权后的目标值，惩罚系数改变后直接用新系数加权，skip_empty时不计没有客户的路径
+        '''
+        if self.cost is None:
+            self.cal_cost(model)
+        distance, capacity, time, battery = self.customer_cost if skip_empty else self.cost
+        return distance+penalty[0]*capacity+penalty[1]*time+penalty[2]*battery
+
+    def get_fingerprint(self) -> int:
+        '''
+        各路径指纹混合后相加，不受路径顺序影响，混合避免不同路径的边凑出相同的和
+        '''
+        if self.fingerprint is None:
+            ret = 0
+            for route in self.routes:
+                ret += Solution.mix(route.get_fingerprint())
+            self.fingerprint = ret & 0xFFFFFFFFFFFFFFFF
+        return self.fingerprint
+
+    @staticmethod
+    def mix(x: int) -> int:
+        # splitmix64的最后一步
+        x = ((x ^ (x >> 30))*0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        x = ((x ^ (x >> 27))*0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+        return x ^ (x >> 31)
+
+    @staticmethod
+    def unique_index(solutions: list) -> list:
+        '''
+        每组相同的解只保留第一个，返回保留的解的下标
+        '''
+        seen = {}
+        ret = []
+        for i, solution in enumerate(solutions):
+            same = seen.setdefault(solution.get_fingerprint(), [])
+            if not any(solution == other for other in same):
+                same.append(solution)
+                ret.append(i)
+        return ret
+
+    def get_customer_position(self, node: Customer) -> tuple:
+        if self.customer_position is None:
+            self.find_position()
+        return self.customer_position[node.index]
+
+    def get_station_position(self, node: Recharger) -> list:
+        if self.station_position is None:
+            self.find_position()
+        return list(self.station_position.get(node.index, ()))
+
     def renumber_id(self) -> None:
         self.id = list(range(len(self.routes)))
         self.next_id = len(self.routes)
@@ -2,6 +2,337 @@ from .model import *
 from .util import *
 
 
+class Move:
+    '''
+    邻域中的一个移动，只构造改动的路径用来评价，选中后才用action生成完整的解\n
+    改动的路径由原解中路径的片段拼成，片段为(第几条路径, lo, hi, step)即visit[lo:hi]，step为-1时倒序，也可以是单个节点\n
+    改动的路径按action的做法清理多余的充电站，没有客户的路径在action中会被删除，评价时不计
+    '''
+    # 构造属性
+    solution = None  # 移动前的解
+    action = None  # 生成解的Modification.*_action
+    args = ()  # action中solution和model之后的参数
+    act = None  # 禁忌属性
+    pieces = {}  # 改动的路径在solution中的下标到片段列表 字典
+    clean = False  # 是否清理改动的路径
+    # 计算属性
+    routes = None  # 改动的路径在solution中的下标到改动后的路径 字典 评价时才构造
+    bound = None  # 评价前由片段得到的(路径数, 目标值下界, 是否一定不可行)
+    delta = None  # 目标值的变化
+    value = None  # 移动后的(路径数, 目标值, 是否可行)
+    fingerprint = None  # 移动后的解的指纹 同Solution.get_fingerprint 只计有客户的路径
+    # 评价设置
+    bound_slack = 1e-9  # 片段拼接与整条计算的舍入误差余量 相对值
+    first_batch = 32  # 第一批评价的移动数 之后每批加倍
+
+    def __init__(self, solution: Solution, action: object, args: tuple, act: tuple, pieces: dict, clean: list) -> None:
+        '''
+        pieces为改动的路径的片段列表，clean为None时不清理，否则清理改动的路径和clean中的路径
+        '''
+        self.solution = solution
+        self.action = action
+        self.args = args
+        self.act = act
+        self.pieces = pieces
+        self.clean = clean is not None
+        if clean is not None:
+            for i in clean:
+                if i not in pieces:
+                    pieces[i] = [(i, 0, len(solution.routes[i].visit), 1)]
+
+    def build(self, model: Model) -> None:
+        self.routes = {}
+        for i, pieces in self.pieces.items():
+            visit = Move.join(self.solution, pieces)
+            if self.clean:
+                Move.clean_visit(visit)
+            self.routes[i] = Route(visit, model)
+
+    def materialize(self, model: Model) -> Solution:
+        return self.action(self.solution, model, *self.args)
+
+    @staticmethod
+    def join(solution: Solution, pieces: list) -> list:
+        visit = []
+        for piece in pieces:
+            if isinstance(piece, tuple):
+                which, lo, hi, step = piece
+                visit += solution.routes[which].visit[lo:hi] if step == 1 else solution.routes[which].visit[lo:hi][::-1]
+            else:
+                visit.append(piece)
+        return visit
+
+    @staticmethod
+    def clean_visit(visit: list) -> None:
+        '''
+        同Route.remove_depot_to_recharger0和remove_successive_recharger，直接修改列表\n
+        删掉的充电站与前一个点或仓库重合，距离、客户数和送货量都不变
+        '''
+        depot = visit[0]
+        while isinstance(visit[1], Recharger) and visit[1].x == depot.x and visit[1].y == depot.y:
+            del visit[1]
+        while isinstance(visit[-2], Recharger) and visit[-2].x == depot.x and visit[-2].y == depot.y:
+            del visit[-2]
+        i = 1
+        while i < len(visit)-1:
+            if isinstance(visit[i], Recharger) and visit[i] == visit[i-1]:
+                del visit[i]
+            i += 1
+
+    @staticmethod
+    def useless_routes(solution: Solution) -> list:
+        '''
+        有多余充电站的路径，relocate_action和exchange_action会清理所有路径
+        '''
+        return [i for i, route in enumerate(solution.routes) if route.has_useless_recharger()]
+
+    @staticmethod
+    def two_opt_star(model: Model, solution: Solution, first_which: int, first_where: int, second_which: int, second_where: int, act: tuple) -> object:
+        len1 = len(solution.routes[first_which].visit)
+        len2 = len(solution.routes[second_which].visit)
+        pieces = {first_which: [(first_which, 0, first_where+1, 1), (second_which, second_where+1, len2, 1)], second_which: [(second_which, 0, second_where+1, 1), (first_which, first_where+1, len1, 1)]}
+        return Move(solution, Modification.two_opt_star_action, (first_which, first_where, second_which, second_where), act, pieces, [])
+
+    @staticmethod
+    def relocate(model: Model, solution: Solution, which: int, where: int, new_which: int, new_where: int, act: tuple, useless: list) -> object:
+        length = len(solution.routes[which].visit)
+        if new_which != which:
+            new_length = len(solution.routes[new_which].visit)
+            pieces = {which: [(which, 0, where, 1), (which, where+1, length, 1)], new_which: [(new_which, 0, new_where, 1), (which, where, where+1, 1), (new_which, new_where, new_length, 1)]}
+        elif new_where > where:
+            pieces = {which: [(which, 0, where, 1), (which, where+1, new_where, 1), (which, where, where+1, 1), (which, new_where, length, 1)]}
+        else:
+            pieces = {which: [(which, 0, new_where, 1), (which, where, where+1, 1), (which, new_where, where, 1), (which, where+1, length, 1)]}
+        return Move(solution, Modification.relocate_action, (which, where, new_which, new_where), act, pieces, useless)
+
+    @staticmethod
+    def exchange(model: Model, solution: Solution, which1: int, where1: int, which2: int, where2: int, act: tuple, useless: list) -> object:
+        length1 = len(solution.routes[which1].visit)
+        if which1 != which2:
+            length2 = len(solution.routes[which2].visit)
+            pieces = {which1: [(which1, 0, where1, 1), (which2, where2, where2+1, 1), (which1, where1+1, length1, 1)], which2: [(which2, 0, where2, 1), (which1, where1, where1+1, 1), (which2, where2+1, length2, 1)]}
+        elif where1 != where2:
+            low, high = min(where1, where2), max(where1, where2)
+            pieces = {which1: [(which1, 0, low, 1), (which1, high, high+1, 1), (which1, low+1, high, 1), (which1, low, low+1, 1), (which1, high+1, length1, 1)]}
+        else:
+            pieces = {which1: [(which1, 0, length1, 1)]}
+        return Move(solution, Modification.exchange_action, (which1, where1, which2, where2), act, pieces, useless)
+
+    @staticmethod
+    def stationInRe(model: Model, solution: Solution, recharger: Recharger, which: int, where: int, act: tuple) -> object:
+        visit = solution.routes[which].visit
+        if visit[where-1] == recharger:
+            pieces = {which: [(which, 0, where-1, 1), (which, where, len(visit), 1)]}
+        else:
+            pieces = {which: [(which, 0, where, 1), recharger, (which, where, len(visit), 1)]}
+        return Move(solution, Modification.stationInRe_action, (recharger, which, where), act, pieces, None)
+
+    @staticmethod
+    def or_opt(model: Model, solution: Solution, which: int, where: int, length: int, new_where: int, act: tuple) -> object:
+        '''
+        同or_opt_visit
+        '''
+        end = len(solution.routes[which].visit)
+        if new_where < where:
+            pieces = {which: [(which, 0, new_where, 1), (which, where, where+length, 1), (which, new_where, where, 1), (which, where+length, end, 1)]}
+        else:
+            pieces = {which: [(which, 0, where, 1), (which, where+length, new_where, 1), (which, where, where+length, 1), (which, new_where, end, 1)]}
+        return Move(solution, Modification.or_opt_action, (which, where, length, new_where), act, pieces, [])
+
+    @staticmethod
+    def or_opt_visit(visit: list, where: int, length: int, new_where: int) -> list:
+        '''
+        把visit[where:where+length]移到visit[new_where]之前
+        '''
+        segment = visit[where:where+length]
+        rest = visit[:where]+visit[where+length:]
+        place = new_where if new_where < where else new_where-length
+        return rest[:place]+segment+rest[place:]
+
+    @staticmethod
+    def two_opt(model: Model, solution: Solution, which: int, where1: int, where2: int, act: tuple) -> object:
+        length = len(solution.routes[which].visit)
+        pieces = {which: [(which, 0, where1, 1), (which, where1, where2+1, -1), (which, where2+1, length, 1)]}
+        return Move(solution, Modification.two_opt_action, (which, where1, where2), act, pieces, [])
+
+    @staticmethod
+    def swap_star(model: Model, solution: Solution, which1: int, where1: int, which2: int, where2: int, place1: int, place2: int, act: tuple) -> object:
+        '''
+        visit1删掉where1后在place1处插入visit2[where2]，visit2同理
+        '''
+        pieces = {which1: Move.swap_star_pieces(solution, which1, where1, place1, (which2, where2, where2+1, 1)), which2: Move.swap_star_pieces(solution, which2, where2, place2, (which1, where1, where1+1, 1))}
+        return Move(solution, Modification.swap_star_action, (which1, where1, which2, where2, place1, place2), act, pieces, [])
+
+    @staticmethod
+    def swap_star_pieces(solution: Solution, which: int, where: int, place: int, inserted: tuple) -> list:
+        length = len(solution.routes[which].visit)
+        if place <= where:
+            return [(which, 0, place, 1), inserted, (which, place, where, 1), (which, where+1, length, 1)]
+        return [(which, 0, where, 1), (which, where+1, place+1, 1), inserted, (which, place+1, length, 1)]
+
+    @staticmethod
+    def cal_value(routes: list, model: Model, penalty: list) -> tuple:
+        '''
+        返回(有客户的路径数, 这些路径的目标值之和, 其中不可行的路径数)
+        '''
+        num = 0
+        objective = 0
+        infeasible = 0
+        for route in routes:
+            if not route.no_customer():
+                distance, capacity, time, battery, violation = route.cal_penalty(model.vehicle)
+                num += 1
+                objective += distance+penalty[0]*capacity+penalty[1]*time+penalty[2]*battery
+                infeasible += violation is not None
+        return num, objective, infeasible
+
+    @staticmethod
+    def customer_keys(routes: list) -> list:
+        return [route.visit_index.tobytes() for route in routes if not route.no_customer()]
+
+    @staticmethod
+    def same_result(move1: object, move2: object) -> bool:
+        '''
+        同一个解上的两个移动，解-旧1+新1与解-旧2+新2相同，即新1+旧2与新2+旧1的有客户路径相同
+        '''
+        old1 = [move1.solution.routes[i] for i in move1.routes]
+        old2 = [move2.solution.routes[i] for i in move2.routes]
+        return sorted(Move.customer_keys(list(move1.routes.values())+old2)) == sorted(Move.customer_keys(list(move2.routes.values())+old1))
+
+    @staticmethod
+    def cal_base(solution: Solution, model: Model, penalty: list) -> tuple:
+        '''
+        返回(解的cal_value, 各路径的混合指纹 没有客户的为0, 指纹之和)
+        '''
+        mixed = [0 if route.no_customer() else Solution.mix(route.get_fingerprint()) for route in solution.routes]
+        return Move.cal_value(solution.routes, model, penalty), mixed, sum(mixed)
+
+    @staticmethod
+    def cal_pieces(model: Model, solution: Solution, pieces: list) -> tuple:
+        '''
+        由各路径的前缀和拼出(距离, 客户数, 送货量)，每个片段常数时间
+        '''
+        distance = 0.0
+        customers = 0
+        delivery = 0.0
+        last = None
+        for piece in pieces:
+            if not isinstance(piece, tuple):
+                first = end = piece.index
+                customers += isinstance(piece, Customer)
+                delivery += max(piece.demand, 0)
+            else:
+                which, lo, hi, step = piece
+                if lo >= hi:
+                    continue
+                index, forward, backward, customer, demand = solution.routes[which].get_summary()
+                if step == 1:
+                    first, end = index[lo], index[hi-1]
+                    distance += forward[hi-1]-forward[lo]
+                else:
+                    first, end = index[hi-1], index[lo]
+                    distance += backward[hi-1]-backward[lo]
+                customers += customer[hi]-customer[lo]
+                delivery += demand[hi]-demand[lo]
+            if last is not None:
+                distance += model.distance[last, first]
+            last = end
+        return distance, customers, delivery
+
+    @staticmethod
+    def cal_bound(move: object, model: Model, penalty: list, base: tuple) -> tuple:
+        '''
+        不构造状态向量，只由片段得到bound，返回改动前各路径的cal_value\n
+        路径数是准确的，下界不计时间和电量惩罚，容量惩罚只计出发时的超载量\n
+        出发时超载或未改动的路径中有不可行的路径时一定不可行
+        '''
+        (num, objective, infeasible), _, _ = base
+        solution = move.solution
+        old = Move.cal_value([solution.routes[i] for i in move.pieces], model, penalty)
+        num -= old[0]
+        objective -= old[1]
+        surely = infeasible-old[2] > 0
+        capacity = model.vehicle.capacity
+        for pieces in move.pieces.values():
+            distance, customers, delivery = Move.cal_pieces(model, solution, pieces)
+            if customers != 0:
+                num += 1
+                objective += distance+penalty[0]*max(delivery-capacity, 0)
+                surely = surely or delivery > capacity*(1+Move.bound_slack)
+        move.bound = (num, objective, surely)
+        return old
+
+    @staticmethod
+    def worse_than(bound: tuple, value: tuple) -> bool:
+        '''
+        bound对应的移动一定比value差，同VNS_TS.compare_value，目标值相同时不能跳过
+        '''
+        num, objective, surely = bound
+        best_num, best_objective, best_feasible = value
+        higher = objective > best_objective+Move.bound_slack*max(abs(best_objective), 1)
+        if best_feasible:
+            return surely or num > best_num or (num == best_num and higher)
+        return surely and higher
+
+    @staticmethod
+    def evaluate_batch(moves: list, olds: list, model: Model, penalty: list, base: dict) -> None:
+        '''
+        所有移动改动的路径一起用RouteBatch计算，移动后的值由改动的路径增减得到\n
+        改动的路径是整条重新计算的，每个移动的代价与改动路径的长度成正比
+        '''
+        for move in moves:
+            move.build(model)
+        routes = [route for move in moves for route in move.routes.values()]
+        batch = RouteBatch(routes, model)
+        batch.evaluate(model.vehicle)
+        batch.save_cost()
+        # 各移动改动后的路径的指纹混合后求和
+        mixed = Solution.mix(batch.fingerprint)
+        mixed[batch.customer_num == 0] = 0
+        new_hash = np.add.reduceat(mixed, np.cumsum([0]+[len(move.routes) for move in moves[:-1]])).tolist()
+        for move, old, key in zip(moves, olds, new_hash):
+            (num, objective, infeasible), old_hash, hash_sum = base[id(move.solution)]
+            for i in move.routes:
+                key -= old_hash[i]
+            move.fingerprint = (hash_sum+key) & 0xFFFFFFFFFFFFFFFF
+            new = Move.cal_value(list(move.routes.values()), model, penalty)
+            move.delta = new[1]-old[1]
+            move.value = (num-old[0]+new[0], objective+move.delta, infeasible-old[2]+new[2] == 0)
+
+    @staticmethod
+    def evaluate_moves(moves: list, model: Model, penalty: list) -> list:
+        '''
+        先由片段得到各移动的bound，按bound从好到差分批评价，每批之后跳过一定比已评价的移动差的移动\n
+        生成的解相同的移动只保留第一个，先比较指纹\n
+        返回评价过并保留的移动，顺序不变，被跳过的移动value为None，不会是VNS_TS.compare_value下最好的移动
+        '''
+        base = {}
+        olds = []
+        for move in moves:
+            if id(move.solution) not in base:
+                base[id(move.solution)] = Move.cal_base(move.solution, model, penalty)
+            olds.append(Move.cal_bound(move, model, penalty, base[id(move.solution)]))
+        rest = sorted(range(len(moves)), key=lambda k: (moves[k].bound[2], moves[k].bound[0], moves[k].bound[1]))
+        evaluated = []
+        size = Move.first_batch
+        while len(rest) != 0:
+            Move.evaluate_batch([moves[k] for k in rest[:size]], [olds[k] for k in rest[:size]], model, penalty, base)
+            evaluated += rest[:size]
+            value = min((moves[k].value for k in evaluated), key=lambda value: (not value[2], value[0] if value[2] else 0, value[1]))
+            rest = [k for k in rest[size:] if not Move.worse_than(moves[k].bound, value)]
+            size *= 2
+        seen = {}
+        ret = []
+        for k in sorted(evaluated):
+            move = moves[k]
+            same = seen.setdefault((id(move.solution), move.fingerprint), [])
+            if any(Move.same_result(move, other) for other in same):
+                continue
+            same.append(move)
+            ret.append(move)
+        return ret
+
+
 class Modification:
     @staticmethod
     def cyclic_exchange(solution: Solution, model: Model, Rts: int, max: int) -> Solution:
@@ -16,13 +347,11 @@ class Modification:
         ret_sol = solution.copy()
         for sel_i in range(len(sel)):
             #ret_sol.routes[sel[sel_i]].visit[actual_select[sel[sel_i]][0]:actual_select[sel[sel_i]][1]] = solution.routes[sel[(sel_i+1) % len(sel)]].visit[actual_select[sel[(sel_i+1) % len(sel)]][0]:actual_select[sel[(sel_i+1) % len(sel)]][1]]
-            ret_sol.routes[sel[sel_i]].replace_nodes(model.vehicle, actual_select[sel[sel_i]][0], actual_select[sel[sel_i]][1], solution.routes[sel[(sel_i+1) % len(sel)]].visit[actual_select[sel[(sel_i+1) % len(sel)]][0]:actual_select[sel[(sel_i+1) % len(sel)]][1]])
+            ret_sol.modify_route(sel[sel_i]).replace_nodes(model.vehicle, actual_select[sel[sel_i]][0], actual_select[sel[sel_i]][1], solution.routes[sel[(sel_i+1) % len(sel)]].visit[actual_select[sel[(sel_i+1) % len(sel)]][0]:actual_select[sel[(sel_i+1) % len(sel)]][1]])
 
         # ret_sol.remove_empty_route()
 
-        for route in ret_sol.routes:
-            route.remove_depot_to_recharger0(model.vehicle)
-            route.remove_successive_recharger(model.vehicle)
+        ret_sol.remove_useless_recharger(model)
 
         return ret_sol
 
@@ -32,13 +361,10 @@ class Modification:
         ret_sol = solution.copy()
         #ret_sol.routes[first_which].visit[first_where+1:] = solution.routes[second_which].visit[second_where+1:]
         #ret_sol.routes[second_which].visit[second_where+1:] = solution.routes[first_which].visit[first_where+1:]
-        ret_sol.routes[first_which].replace_nodes(model.vehicle, first_where+1, len(ret_sol.routes[first_which].visit), solution.routes[second_which].visit[second_where+1:])
-        ret_sol.routes[second_which].replace_nodes(model.vehicle, second_where+1, len(ret_sol.routes[second_which].visit), solution.routes[first_which].visit[first_where+1:])
+        ret_sol.modify_route(first_which).replace_nodes(model.vehicle, first_where+1, len(ret_sol.routes[first_which].visit), solution.routes[second_which].visit[second_where+1:])
+        ret_sol.modify_route(second_which).replace_nodes(model.vehicle, second_where+1, len(ret_sol.routes[second_which].visit), solution.routes[first_which].visit[first_where+1:])
 
-        ret_sol.routes[first_which].remove_depot_to_recharger0(model.vehicle)
-        ret_sol.routes[first_which].remove_successive_recharger(model.vehicle)
-        ret_sol.routes[second_which].remove_depot_to_recharger0(model.vehicle)
-        ret_sol.routes[second_which].remove_successive_recharger(model.vehicle)
+        ret_sol.remove_useless_recharger(model, [first_which, second_which])
 
         ret_sol.remove_empty_route()
 
@@ -70,25 +396,23 @@ class Modification:
         ret_sol = solution.copy()
         if new_which != which:
             #ret_sol[new_which].visit.insert(new_where, solution.routes[which].visit[where])
-            ret_sol[new_which].add_node(model.vehicle, new_where, solution.routes[which].visit[where])
+            ret_sol.modify_route(new_which).add_node(model.vehicle, new_where, solution.routes[which].visit[where])
             #del ret_sol.routes[which].visit[where]
-            ret_sol.routes[which].del_node(model.vehicle, where)
+            ret_sol.modify_route(which).del_node(model.vehicle, where)
             # if ret_sol.routes[which].no_customer():
             #    ret_sol.remove_route_index(which)
         else:
             #ret_sol[which].add_node(new_where, solution.routes[which].visit[where])
-            ret_sol[new_which].add_node(model.vehicle, new_where, solution.routes[which].visit[where])
+            ret_sol.modify_route(new_which).add_node(model.vehicle, new_where, solution.routes[which].visit[where])
             if new_where > where:
                 #del ret_sol.routes[which].visit[where]
-                ret_sol.routes[which].del_node(model.vehicle, where)
+                ret_sol.modify_route(which).del_node(model.vehicle, where)
             else:
                 #del ret_sol.routes[which].visit[where+1]
-                ret_sol.routes[which].del_node(model.vehicle, where+1)
+                ret_sol.modify_route(which).del_node(model.vehicle, where+1)
 
         ret_sol.remove_empty_route()
-        for route in ret_sol.routes:
-            route.remove_depot_to_recharger0(model.vehicle)
-            route.remove_successive_recharger(model.vehicle)
+        ret_sol.remove_useless_recharger(model)
 
         return ret_sol
 
@@ -119,14 +443,12 @@ class Modification:
     def exchange_action(solution: Solution, model: Model, which1: int, where1: int, which2: int, where2: int) -> Solution:
         ret_sol = solution.copy()
         #ret_sol.routes[which1].visit[where1] = solution.routes[which2].visit[where2]
-        ret_sol.routes[which1].replace_node(model.vehicle, where1, solution.routes[which2].visit[where2])
+        ret_sol.modify_route(which1).replace_node(model.vehicle, where1, solution.routes[which2].visit[where2])
         #ret_sol.routes[which2].visit[where2] = solution.routes[which1].visit[where1]
-        ret_sol.routes[which2].replace_node(model.vehicle, where2, solution.routes[which1].visit[where1])
+        ret_sol.modify_route(which2).replace_node(model.vehicle, where2, solution.routes[which1].visit[where1])
 
         ret_sol.remove_empty_route()
-        for route in ret_sol:
-            route.remove_depot_to_recharger0(model.vehicle)
-            route.remove_successive_recharger(model.vehicle)
+        ret_sol.remove_useless_recharger(model)
 
         return ret_sol
 
@@ -137,10 +459,17 @@ class Modification:
         while not isinstance(solution.routes[which].visit[where], Customer):
             which = random.randint(0, len(solution.routes)-1)
             where = random.randint(1, len(solution.routes[which].visit)-2)
-        recharger = random.choice(model.rechargers)
-        depot = solution.routes[0].visit[0]
-        while recharger.x == depot.x and recharger.y == depot.y and (where == 1 or where == len(solution.routes[which].visit)-2):
-            recharger = random.choice(model.rechargers)
+        route = solution.routes[which]
+        depot = route.visit[0]
+        # 只从插入位置两侧的候选充电站中选，前面已经是充电站时选它就是删除
+        candidate = model.get_station_candidates(route.visit[where-1], route.visit[where])
+        if isinstance(route.visit[where-1], Recharger):
+            candidate.append(route.visit[where-1])
+        for stations in [candidate, model.useful_station]:
+            stations = [rec for rec in stations if not (rec.x == depot.x and rec.y == depot.y and (where == 1 or where == len(route.visit)-2))]
+            if len(stations) != 0:
+                break
+        recharger = random.choice(stations)
         return recharger, which, where
 
     @staticmethod
@@ -148,10 +477,10 @@ class Modification:
         ret_sol = solution.copy()
         if ret_sol.routes[which].visit[where-1]==recharger:
             #del ret_sol.routes[which].visit[where-1]
-            ret_sol.routes[which].del_node(model.vehicle, where-1)
+            ret_sol.modify_route(which).del_node(model.vehicle, where-1)
         else:
             #ret_sol.routes[which].visit.insert(where, recharger)
-            ret_sol.routes[which].add_node(model.vehicle, where, recharger)
+            ret_sol.modify_route(which).add_node(model.vehicle, where, recharger)
         # ret_sol.routes[which].remove_depot_to_recharger0()
         ret_sol.remove_empty_route()
         return ret_sol
@@ -171,17 +500,46 @@ class Modification:
         ret_sol = solution.copy()
         #ret_sol.routes[which].visit[where1:where2+1] = reversed(solution.routes[which].visit[where1:where2+1])
         # ret_sol.routes[which].clear_status()
-        ret_sol.routes[which].replace_nodes(model.vehicle, where1, where2+1, reversed(solution.routes[which].visit[where1:where2+1]))
+        ret_sol.modify_route(which).replace_nodes(model.vehicle, where1, where2+1, reversed(solution.routes[which].visit[where1:where2+1]))
 
-        for route in ret_sol.routes:
-            if isinstance(route.visit[1], Recharger) and route.visit[1].x == route.visit[0].x and route.visit[1].y == route.visit[0].y:
-                #del route.visit[1]
-                route.del_node(model.vehicle, 1)
-            if isinstance(route.visit[-2], Recharger) and route.visit[-2].x == route.visit[0].x and route.visit[-2].y == route.visit[0].y:
-                #del route.visit[-2]
-                route.del_node(model.vehicle, len(route.visit)-2)
+        # 反转只改变这一条路径，其它路径不用清理
+        ret_sol.remove_useless_recharger(model, [which])
 
-        ret_sol.routes[which].remove_successive_recharger(model.vehicle)
+        ret_sol.remove_empty_route()
+
+        return ret_sol
+
+    @staticmethod
+    def or_opt_action(solution: Solution, model: Model, which: int, where: int, length: int, new_where: int) -> Solution:
+        ret_sol = solution.copy()
+        visit = Move.or_opt_visit(solution.routes[which].visit, where, length, new_where)
+        start = min(where, new_where)
+        end = max(where+length, new_where)
+        ret_sol.modify_route(which).replace_nodes(model.vehicle, start, end, visit[start:end])
+
+        ret_sol.remove_useless_recharger(model, [which])
+
+        ret_sol.remove_empty_route()
+
+        return ret_sol
+
+    @staticmethod
+    def swap_star_action(solution: Solution, model: Model, which1: int, where1: int, which2: int, where2: int, place1: int, place2: int) -> Solution:
+        '''
+        两条路径的点互换，place1为visit2[where2]插入到去掉visit1[where1]后的路径1中的位置，place2同
+        '''
+        assert which1 != which2
+        ret_sol = solution.copy()
+        route1 = ret_sol.modify_route(which1)
+        route1.del_node(model.vehicle, where1)
+        route1.add_node(model.vehicle, place1, solution.routes[which2].visit[where2])
+        route2 = ret_sol.modify_route(which2)
+        route2.del_node(model.vehicle, where2)
+        route2.add_node(model.vehicle, place2, solution.routes[which1].visit[where1])
+
+        ret_sol.remove_useless_recharger(model, [which1, which2])
+
+        ret_sol.remove_empty_route()
 
         return ret_sol
 
@@ -198,11 +556,7 @@ class Modification:
             rest_routes_index.remove(select)
             visit_list = solution.routes[select].visit[1:-1]
             random.shuffle(visit_list)
-            for node in visit_list:
-                if isinstance(node, Customer):
-                    to_route, insert_place_to_route = Operation.choose_best_insert(solution, node, rest_routes_index)
-                    #solution.routes[to_route].visit.insert(insert_place_to_route, node)
-                    solution.routes[to_route].add_node(model.vehicle, insert_place_to_route, node)
+            Operation.insert_nodes(solution, model, [node for node in visit_list if isinstance(node, Customer)], rest_routes_index)
             solution.remove_route_index(select)
         solution.clear_status()
         return solution
@@ -221,20 +575,18 @@ class Modification:
             if isinstance(node, Customer):
                 visit_cus_list.append(node)
 
-        for route in solution1.routes:
+        for which, route in enumerate(solution1.routes):
             i = 1
             while i < len(route.visit)-1:
                 if route.visit[i] in visit_cus_list:
                     #del route.visit[i]
+                    route = solution1.modify_route(which)
                     route.del_node(model.vehicle, i)
                 else:
                     i += 1
 
         random.shuffle(visit_cus_list)
-        for node in visit_cus_list:
-            to_route, insert_place_to_route = Operation.choose_best_insert(solution1, node, list(range(len(solution1.routes))))
-            #solution1.routes[to_route].visit.insert(insert_place_to_route, node)
-            solution1.routes[to_route].add_node(model.vehicle, insert_place_to_route, node)
+        Operation.insert_nodes(solution1, model, visit_cus_list, list(range(len(solution1.routes))))
         solution1.remove_empty_route()
         solution1.clear_status()
         return solution1
@@ -243,8 +595,9 @@ class Modification:
     def charging_modification(solution: Solution, model: Model) -> Solution:
         solution = solution.copy()
         ready_to_remove = []
-        for route in solution.routes:
+        for which, route in enumerate(solution.routes):
             if route.feasible_capacity(model.vehicle)[0] and route.feasible_time(model.vehicle)[0] and not route.feasible_battery(model.vehicle)[0]:
+                route = solution.modify_route(which)
                 left_fail_index = np.where(route.arrive_remain_battery < 0)[0][0]
                 left = np.where(route.rechargers < left_fail_index)[0]
                 if len(left) != 0:
@@ -291,9 +644,9 @@ class Modification:
                         cut_point = left_insert[-1]
                         if cut_point == len(route.visit)-1:
                             cut_point -= 1
-                        solution.add_route(Route(route.visit[0:cut_point]+[model.depot]))
+                        solution.add_route(Route(route.visit[0:cut_point]+[model.depot], model))
                         assert len(solution[-1].visit) != 2
-                        solution.add_route(Route([model.depot]+route.visit[cut_point:]))
+                        solution.add_route(Route([model.depot]+route.visit[cut_point:], model))
                         assert len(solution[-1].visit) != 2
                         ready_to_remove.append(route)
                 elif len(common_insert) == 0 and len(right_insert) == 0:
@@ -314,9 +667,9 @@ class Modification:
                         cut_point = left_insert[-1]
                         if cut_point == len(route.visit)-1:
                             cut_point -= 1
-                        solution.add_route(Route(route.visit[0:cut_point]+[model.depot]))
+                        solution.add_route(Route(route.visit[0:cut_point]+[model.depot], model))
                         assert len(solution[-1].visit) != 2
-                        solution.add_route(Route([model.depot]+route.visit[cut_point:]))
+                        solution.add_route(Route([model.depot]+route.visit[cut_point:], model))
                         assert len(solution[-1].visit) != 2
                         ready_to_remove.append(route)
                 elif len(common_insert) != 0:
@@ -338,9 +691,9 @@ class Modification:
                         cut_point = common_insert[-1]
                         if cut_point == len(route.visit)-1:
                             cut_point -= 1
-                        solution.add_route(Route(route.visit[0:cut_point]+[model.depot]))
+                        solution.add_route(Route(route.visit[0:cut_point]+[model.depot], model))
                         assert len(solution[-1].visit) != 2
-                        solution.add_route(Route([model.depot]+route.visit[cut_point:]))
+                        solution.add_route(Route([model.depot]+route.visit[cut_point:], model))
                         assert len(solution[-1].visit) != 2
                         ready_to_remove.append(route)
                 else:
@@ -357,8 +710,9 @@ class Modification:
     def fix_time(solution: Solution, model: Model) -> Solution:
         solution = solution.copy()
 
-        for route in solution.routes:
+        for which, route in enumerate(solution.routes):
             if route.feasible_time(model.vehicle)[0] == False:
+                route = solution.modify_route(which)
                 cut = route.feasible_time(model.vehicle)[1]
                 if cut == len(route.visit)-1:
                     cut -= 1
@@ -366,82 +720,72 @@ class Modification:
                 #route.visit[cut:] = [model.depot]
                 # route.clear_status()
                 route.replace_nodes(model.vehicle, cut, len(route.visit), [model.depot])
-                solution.add_route(Route(new_route))
+                solution.add_route(Route(new_route, model))
 
         solution.remove_empty_route()
 
         return solution
 
     @staticmethod
-    def two_opt_star_arc(model: Model, solution: Solution, node1: Node, node2: Node) -> tuple:
+    def two_opt_star_arc(model: Model, solution: Solution, node1: Node, node2: Node) -> list:
         '''
-        a后的边，与b前的边，去掉，交换后半部分再连起来，路间
+        a后的边，与b前的边，去掉，交换后半部分再连起来，路间\n
+        *_arc都返回Move列表，不生成解
         '''
         assert not node1==node2
         if isinstance(node1, Customer) and isinstance(node2, Customer):
             which1, where1, which2, where2 = Operation.find_two_customer(solution, node1, node2)
             if which1 == which2:
-                return [], []
+                return []
             else:
-                sol = Modification.two_opt_star_action(solution, model, which1, where1, which2, where2-1)
+                if not Operation.two_opt_star_possible(model, solution, which1, where1, which2, where2-1):
+                    return []
                 act = ((node1, node2), solution.id[which1], *Operation.find_left_right_station(solution.routes[which1], where1))
-                return [sol], [act]
+                return [Move.two_opt_star(model, solution, which1, where1, which2, where2-1, act)]
         elif isinstance(node1, Customer) and isinstance(node2, Recharger):
             which1, where1, recharger2_which_where = Operation.find_customer_recharger(solution, node1, node2)
-            ret_sol = []
-            ret_act = []
+            ret = []
             for which2, where2 in recharger2_which_where:
-                if which1 != which2:
-                    sol = Modification.two_opt_star_action(solution, model, which1, where1, which2, where2-1)
-                    ret_sol.append(sol)
+                if which1 != which2 and Operation.two_opt_star_possible(model, solution, which1, where1, which2, where2-1):
                     act = ((node1, node2), solution.id[which1], *Operation.find_left_right_station(solution.routes[which1], where1))
-                    ret_act.append(act)
-            return ret_sol, ret_act
+                    ret.append(Move.two_opt_star(model, solution, which1, where1, which2, where2-1, act))
+            return ret
         elif isinstance(node1, Customer) and isinstance(node2, Depot):
             which1, where1 = Operation.find_customer(solution, node1)
             if where1 == len(solution.routes[which1].visit)-2:
-                return [], []
-            ret_sol = []
-            ret_act = []
+                return []
+            ret = []
             solution = solution.copy()
             solution.add_empty_route(model)
             which2 = 0
             while which2 < len(solution.routes):
                 if which1 != which2:
                     where2 = len(solution.routes[which2])-1
-                    sol = Modification.two_opt_star_action(solution, model, which1, where1, which2, where2-1)
-                    ret_sol.append(sol)
-                    act = ((node1, node2), solution.id[which1], *Operation.find_left_right_station(solution.routes[which1], where1))
-                    ret_act.append(act)
+                    if Operation.two_opt_star_possible(model, solution, which1, where1, which2, where2-1):
+                        act = ((node1, node2), solution.id[which1], *Operation.find_left_right_station(solution.routes[which1], where1))
+                        ret.append(Move.two_opt_star(model, solution, which1, where1, which2, where2-1, act))
                 which2 += 1
-            return ret_sol, ret_act
+            return ret
         elif isinstance(node1, Recharger) and isinstance(node2, Customer):
             which2, where2, recharger1_which_where = Operation.find_customer_recharger(solution, node2, node1)
-            ret_sol = []
-            ret_act = []
+            ret = []
             for which1, where1 in recharger1_which_where:
-                if which1 != which2:
-                    sol = Modification.two_opt_star_action(solution, model, which1, where1, which2, where2-1)
-                    ret_sol.append(sol)
+                if which1 != which2 and Operation.two_opt_star_possible(model, solution, which1, where1, which2, where2-1):
                     act = ((node1, node2), solution.id[which1], *Operation.find_left_right_station(solution.routes[which1], where1))
-                    ret_act.append(act)
-            return ret_sol, ret_act
+                    ret.append(Move.two_opt_star(model, solution, which1, where1, which2, where2-1, act))
+            return ret
         elif isinstance(node1, Recharger) and isinstance(node2, Recharger):
             recharger1_which_where, recharger2_which_where = Operation.find_two_recharger(solution, node1, node2)
-            ret_sol = []
-            ret_act = []
+            ret = []
             for which1, where1 in recharger1_which_where:
                 for which2, where2 in recharger2_which_where:
-                    if which1 != which2:
-                        sol = Modification.two_opt_star_action(solution, model, which1, where1, which2, where2-1)
-                        ret_sol.append(sol)
+                    if which1 != which2 and Operation.two_opt_star_possible(model, solution, which1, where1, which2, where2-1):
                         act = ((node1, node2), solution.id[which1], *Operation.find_left_right_station(solution.routes[which1], where1))
-                        ret_act.append(act)
-            return ret_sol, ret_act
+                        ret.append(Move.two_opt_star(model, solution, which1, where1, which2, where2-1, act))
+            return ret
         elif isinstance(node1, Recharger) and isinstance(node2, Depot):
             recharger1_which_where = Operation.find_recharger(solution, node1)
-            ret_sol = []
-            ret_act = []
+            ret = []
             solution = solution.copy()
             solution.add_empty_route(model)
             for which1, where1 in recharger1_which_where:
@@ -451,33 +795,28 @@ class Modification:
                 while which2 < len(solution.routes):
                     if which1 != which2:
                         where2 = len(solution.routes[which2])-1
-                        sol = Modification.two_opt_star_action(solution, model, which1, where1, which2, where2-1)
-                        ret_sol.append(sol)
-                        act = ((node1, node2), solution.id[which1], *Operation.find_left_right_station(solution.routes[which1], where1))
-                        ret_act.append(act)
+                        if Operation.two_opt_star_possible(model, solution, which1, where1, which2, where2-1):
+                            act = ((node1, node2), solution.id[which1], *Operation.find_left_right_station(solution.routes[which1], where1))
+                            ret.append(Move.two_opt_star(model, solution, which1, where1, which2, where2-1, act))
                     which2 += 1
-            return ret_sol, ret_act
+            return ret
         elif isinstance(node1, Depot) and isinstance(node2, Customer):
             which2, where2 = Operation.find_customer(solution, node2)
             if where2 == 1:
-                return [], []
-            ret_sol = []
-            ret_act = []
+                return []
+            ret = []
             solution = solution.copy()
             solution.add_empty_route(model)
             which1 = 0
             while which1 < len(solution.routes):
-                if which1 != which2:
-                    sol = Modification.two_opt_star_action(solution, model, which1, 0, which2, where2-1)
-                    ret_sol.append(sol)
+                if which1 != which2 and Operation.two_opt_star_possible(model, solution, which1, 0, which2, where2-1):
                     act = ((node1, node2), solution.id[which1], node1, Operation.find_right_station(solution.routes[which1], 0))
-                    ret_act.append(act)
+                    ret.append(Move.two_opt_star(model, solution, which1, 0, which2, where2-1, act))
                 which1 += 1
-            return ret_sol, ret_act
+            return ret
         elif isinstance(node1, Depot) and isinstance(node2, Recharger):
             recharger2_which_where = Operation.find_recharger(solution, node2)
-            ret_sol = []
-            ret_act = []
+            ret = []
             solution = solution.copy()
             solution.add_empty_route(model)
             which1 = 0
@@ -485,33 +824,32 @@ class Modification:
                 for which2, where2 in recharger2_which_where:
                     if where2 == 1:
                         continue
-                    if which1 != which2:
-                        sol = Modification.two_opt_star_action(solution, model, which1, 0, which2, where2-1)
-                        ret_sol.append(sol)
+                    if which1 != which2 and Operation.two_opt_star_possible(model, solution, which1, 0, which2, where2-1):
                         act = ((node1, node2), solution.id[which1], node1, Operation.find_right_station(solution.routes[which1], 1))
-                        ret_act.append(act)
+                        ret.append(Move.two_opt_star(model, solution, which1, 0, which2, where2-1, act))
                 which1 += 1
-            return ret_sol, ret_act
+            return ret
 
     @staticmethod
-    def relocate_arc(model: Model, solution: Solution, node1: Node, node2: Node) -> tuple:
+    def relocate_arc(model: Model, solution: Solution, node1: Node, node2: Node) -> list:
         '''
         去掉a，插入到b前，路间路内，客户与电站
         '''
         assert not node1==node2
+        useless = Move.useless_routes(solution)
         if isinstance(node1, Depot):
-            return [], []
+            return []
         elif isinstance(node1, Customer) and isinstance(node2, Customer):
             which1, where1, which2, where2 = Operation.find_two_customer(solution, node1, node2)
             if which1 == which2 and where2 == where1+1:
-                return [], []
-            sol = Modification.relocate_action(solution, model, which1, where1, which2, where2)
+                return []
+            if not Operation.relocate_possible(model, solution, which1, where1, which2, where2):
+                return []
             act = ((node1, node2), solution.id[which2], *Operation.find_left_right_station(solution.routes[which2], where2))
-            return [sol], [act]
+            return [Move.relocate(model, solution, which1, where1, which2, where2, act, useless)]
         elif isinstance(node1, Customer) and isinstance(node2, Depot):
             which1, where1 = Operation.find_customer(solution, node1)
-            ret_sol = []
-            ret_act = []
+            ret = []
             if len(solution.routes[which1].visit) != 3:
                 solution = solution.copy()
                 solution.add_empty_route(model)
@@ -519,179 +857,372 @@ class Modification:
             while which2 < len(solution.routes):
                 if not (which2 == which1 and where1 == len(solution.routes[which2].visit)-2):
                     where2 = len(solution.routes[which2].visit)-1
-                    sol = Modification.relocate_action(solution, model, which1, where1, which2, where2)
-                    act = ((node1, node2), solution.id[which2], Operation.find_left_station(solution.routes[which2], where2), node2)
-                    ret_sol.append(sol)
-                    ret_act.append(act)
+                    if Operation.relocate_possible(model, solution, which1, where1, which2, where2):
+                        act = ((node1, node2), solution.id[which2], Operation.find_left_station(solution.routes[which2], where2), node2)
+                        ret.append(Move.relocate(model, solution, which1, where1, which2, where2, act, useless))
                 which2 += 1
-            return ret_sol, ret_act
+            return ret
         elif isinstance(node1, Customer) and isinstance(node2, Recharger):
             which1, where1, recharger2_which_where = Operation.find_customer_recharger(solution, node1, node2)
-            ret_sol = []
-            ret_act = []
+            ret = []
             for which2, where2 in recharger2_which_where:
-                if not (which1 == which2 and where2 == where1+1):
-                    sol = Modification.relocate_action(solution, model, which1, where1, which2, where2)
-                    ret_sol.append(sol)
+                if not (which1 == which2 and where2 == where1+1) and Operation.relocate_possible(model, solution, which1, where1, which2, where2):
                     act = ((node1, node2), solution.id[which2], *Operation.find_left_right_station(solution.routes[which2], where2))
-                    ret_act.append(act)
-            return ret_sol, ret_act
+                    ret.append(Move.relocate(model, solution, which1, where1, which2, where2, act, useless))
+            return ret
         elif isinstance(node1, Recharger) and isinstance(node2, Customer):
             which2, where2, recharger1_which_where = Operation.find_customer_recharger(solution, node2, node1)
-            ret_sol = []
-            ret_act = []
+            ret = []
             for which1, where1 in recharger1_which_where:
-                if not (which1 == which2 and where2 == where1+1):
-                    sol = Modification.relocate_action(solution, model, which1, where1, which2, where2)
-                    ret_sol.append(sol)
+                if not (which1 == which2 and where2 == where1+1) and Operation.relocate_possible(model, solution, which1, where1, which2, where2):
                     act = ((node1, node2), solution.id[which2], *Operation.find_left_right_station(solution.routes[which2], where2))
-                    ret_act.append(act)
-            return ret_sol, ret_act
+                    ret.append(Move.relocate(model, solution, which1, where1, which2, where2, act, useless))
+            return ret
         elif isinstance(node1, Recharger) and isinstance(node2, Depot):
             if node1.x == node2.x and node1.y == node2.y:
-                return [], []
+                return []
             recharger1_which_where = Operation.find_recharger(solution, node1)
-            ret_sol = []
-            ret_act = []
+            ret = []
             for which1, where1 in recharger1_which_where:
                 which2 = 0
                 while which2 < len(solution.routes):
                     if not (which2 == which1 and where1 == len(solution.routes[which2].visit)-2):
                         where2 = len(solution.routes[which2].visit)-1
-                        sol = Modification.relocate_action(solution, model, which1, where1, which2, where2)
-                        ret_sol.append(sol)
-                        act = ((node1, node2), solution.id[which2], Operation.find_left_station(solution.routes[which2], where2), node2)
-                        ret_act.append(act)
+                        if Operation.relocate_possible(model, solution, which1, where1, which2, where2):
+                            act = ((node1, node2), solution.id[which2], Operation.find_left_station(solution.routes[which2], where2), node2)
+                            ret.append(Move.relocate(model, solution, which1, where1, which2, where2, act, useless))
                     which2 += 1
-            return ret_sol, ret_act
+            return ret
         elif isinstance(node1, Recharger) and isinstance(node2, Recharger):
             recharger1_which_where, recharger2_which_where = Operation.find_two_recharger(solution, node1, node2)
-            ret_sol = []
-            ret_act = []
+            ret = []
             for which1, where1 in recharger1_which_where:
                 for which2, where2 in recharger2_which_where:
-                    if not (which1 == which2 and where1+1 == where2):
-                        sol = Modification.relocate_action(solution, model, which1, where1, which2, where2)
-                        ret_sol.append(sol)
+                    if not (which1 == which2 and where1+1 == where2) and Operation.relocate_possible(model, solution, which1, where1, which2, where2):
                         act = ((node1, node2), solution.id[which2], *Operation.find_left_right_station(solution.routes[which2], where2))
-                        ret_act.append(act)
-            return ret_sol, ret_act
+                        ret.append(Move.relocate(model, solution, which1, where1, which2, where2, act, useless))
+            return ret
 
     @staticmethod
-    def exchange_arc(model: Model, solution: Solution, node1: Node, node2: Node) -> tuple:
+    def exchange_arc(model: Model, solution: Solution, node1: Node, node2: Node) -> list:
         '''
         a后与b交换，路间路内，只有客户
         '''
         assert not node1==node2
+        useless = Move.useless_routes(solution)
         if isinstance(node2, Customer):
             if isinstance(node1, Customer):
                 which1, where1, which2, where2 = Operation.find_two_customer(solution, node1, node2)
                 if (not isinstance(solution.routes[which1].visit[where1+1], Customer)) or where1 == len(solution.routes[which1])-2 or (which1 == which2 and where2 == where1+1):
-                    return [], []
+                    return []
                 else:
-                    sol = Modification.exchange_action(solution, model, which1, where1+1, which2, where2)
+                    if not Operation.exchange_possible(model, solution, which1, where1+1, which2, where2):
+                        return []
                     act = ((node1, node2), solution.id[which1], *Operation.find_left_right_station(solution.routes[which1], where1))
-                    return [sol], [act]
+                    return [Move.exchange(model, solution, which1, where1+1, which2, where2, act, useless)]
             elif isinstance(node1, Depot):
                 which2, where2 = Operation.find_customer(solution, node2)
-                ret_sol = []
-                ret_act = []
+                ret = []
                 which1 = 0
                 while which1 < len(solution.routes):
-                    if isinstance(solution.routes[which1].visit[1], Customer) and not (where2 == 1 and which1 == which2):
-                        sol = Modification.exchange_action(solution, model, which1, 1, which2, where2)
-                        ret_sol.append(sol)
+                    if isinstance(solution.routes[which1].visit[1], Customer) and not (where2 == 1 and which1 == which2) and Operation.exchange_possible(model, solution, which1, 1, which2, where2):
                         act = ((node1, node2), solution.id[which1], node1, Operation.find_right_station(solution.routes[which1], 0))
-                        ret_act.append(act)
+                        ret.append(Move.exchange(model, solution, which1, 1, which2, where2, act, useless))
                     which1 += 1
-                return ret_sol, ret_act
+                return ret
             elif isinstance(node1, Recharger):
                 which2, where2, recharger1_which_where = Operation.find_customer_recharger(solution, node2, node1)
-                ret_sol = []
-                ret_act = []
+                ret = []
                 for which1, where1 in recharger1_which_where:
-                    if isinstance(solution.routes[which1].visit[where1+1], Customer) and where1 != len(solution.routes[which1])-2 and not (which1 == which2 and where2 == where1+1):
-                        sol = Modification.exchange_action(solution, model, which1, where1+1, which2, where2)
-                        ret_sol.append(sol)
+                    if isinstance(solution.routes[which1].visit[where1+1], Customer) and where1 != len(solution.routes[which1])-2 and not (which1 == which2 and where2 == where1+1) and Operation.exchange_possible(model, solution, which1, where1+1, which2, where2):
                         act = ((node1, node2), solution.id[which1], *Operation.find_left_right_station(solution.routes[which1], where1))
-                        ret_act.append(act)
-                return ret_sol, ret_act
+                        ret.append(Move.exchange(model, solution, which1, where1+1, which2, where2, act, useless))
+                return ret
             else:
                 raise Exception('impossible')
         else:
-            return [], []
+            return []
 
     @staticmethod
-    def stationInRe_arc(model: Model, solution: Solution, node1: Recharger, node2: Node) -> tuple:
+    def stationInRe_arc(model: Model, solution: Solution, node1: Recharger, node2: Node) -> list:
         assert not node1==node2
         if not isinstance(node1, Recharger):
-            return [], []
+            return []
         if isinstance(node2, Customer):
             which2, where2 = Operation.find_customer(solution, node2)
             if where2 == 1:
                 depot = solution.routes[0].visit[0]
                 if node1.x == depot.x and node1.y == depot.y:
-                    return [], []
-            sol = Modification.stationInRe_action(solution, model, node1, which2, where2)
+                    return []
+            if not Operation.is_station_candidate(model, solution.routes[which2], where2, node1):
+                return []
             act = ((node1, node2), solution.id[which2], *Operation.find_left_right_station(solution.routes[which2], where2))
-            return [sol], [act]
+            return [Move.stationInRe(model, solution, node1, which2, where2, act)]
         elif isinstance(node2, Depot):
             if node1.x == node2.x and node1.y == node2.y:
                 return []
-            ret_sol = []
-            ret_act = []
+            ret = []
             cur_which = 0
             while cur_which < len(solution.routes):
                 cur_where = len(solution.routes[cur_which].visit)-1
-                sol = Modification.stationInRe_action(solution, model, node1, cur_which, cur_where)
-                ret_sol.append(sol)
+                if not Operation.is_station_candidate(model, solution.routes[cur_which], cur_where, node1):
+                    cur_which += 1
+                    continue
                 act = ((node1, node2), solution.id[cur_which], Operation.find_left_station(solution.routes[cur_which], cur_where), node2)
-                ret_act.append(act)
+                ret.append(Move.stationInRe(model, solution, node1, cur_which, cur_where, act))
                 cur_which += 1
-            return ret_sol, ret_act
+            return ret
         elif isinstance(node2, Recharger):
             recharger2_which_where = Operation.find_recharger(solution, node2)
-            ret_sol = []
-            ret_act = []
+            ret = []
             for which2, where2 in recharger2_which_where:
                 if where2 == 1:
                     depot = solution.routes[0].visit[0]
                     if node1.x == depot.x and node1.y == depot.y:
                         continue
-                sol = Modification.stationInRe_action(solution, model, node1, which2, where2)
-                ret_sol.append(sol)
+                if not Operation.is_station_candidate(model, solution.routes[which2], where2, node1):
+                    continue
                 act = ((node1, node2), solution.id[which2], *Operation.find_left_right_station(solution.routes[which2], where2))
-                ret_act.append(act)
-            return ret_sol, ret_act
+                ret.append(Move.stationInRe(model, solution, node1, which2, where2, act))
+            return ret
         else:
             raise Exception('impossible')
 
+    @staticmethod
+    def or_opt_arc(model: Model, solution: Solution, node1: Node, node2: Node) -> list:
+        '''
+        a开始的1到3个点移到b前，路内，a为客户\n
+        评价时改动的那条路径整条重新计算，代价与路径长度成正比
+        '''
+        assert not node1==node2
+        if not isinstance(node1, Customer):
+            return []
+        which1, where1 = Operation.find_customer(solution, node1)
+        if isinstance(node2, Customer):
+            which2, where2 = Operation.find_customer(solution, node2)
+            new_wheres = [where2] if which2 == which1 else []
+        elif isinstance(node2, Recharger):
+            new_wheres = [where2 for which2, where2 in Operation.find_recharger(solution, node2) if which2 == which1]
+        else:
+            new_wheres = [len(solution.routes[which1].visit)-1]
+        route = solution.routes[which1]
+        ret = []
+        for where2 in new_wheres:
+            if where2 == 0:
+                continue
+            act = ((node1, node2), solution.id[which1], *Operation.find_left_right_station(route, where2))
+            for length in range(1, 4):
+                if where1+length > len(route.visit)-1 or where1 <= where2 <= where1+length:
+                    continue
+                if Operation.or_opt_possible(model, solution, which1, where1, length, where2):
+                    ret.append(Move.or_opt(model, solution, which1, where1, length, where2, act))
+        return ret
+
+    @staticmethod
+    def two_opt_arc(model: Model, solution: Solution, node1: Node, node2: Node) -> list:
+        '''
+        a后的边与b后的边去掉，a与b相连，中间部分反转，路内\n
+        反转部分的到达时间和电量都会变，评价时整条路径重新计算
+        '''
+        assert not node1==node2
+        if isinstance(node2, Depot):
+            return []
+        if isinstance(node2, Customer):
+            node2_which_where = [Operation.find_customer(solution, node2)]
+        else:
+            node2_which_where = Operation.find_recharger(solution, node2)
+        ret = []
+        for which2, where2 in node2_which_where:
+            route = solution.routes[which2]
+            if isinstance(node1, Depot):
+                node1_where = [0]
+            elif isinstance(node1, Customer):
+                which1, where1 = Operation.find_customer(solution, node1)
+                node1_where = [where1] if which1 == which2 else []
+            else:
+                node1_where = [where1 for which1, where1 in Operation.find_recharger(solution, node1) if which1 == which2]
+            for where1 in node1_where:
+                if where2-where1 < 2 or not Operation.two_opt_possible(model, solution, which2, where1+1, where2):
+                    continue
+                if where1 == 0:
+                    act = ((node1, node2), solution.id[which2], node1, Operation.find_right_station(route, 0))
+                else:
+                    act = ((node1, node2), solution.id[which2], *Operation.find_left_right_station(route, where1))
+                ret.append(Move.two_opt(model, solution, which2, where1+1, where2, act))
+        return ret
+
+    @staticmethod
+    def swap_star_arc(model: Model, solution: Solution, node1: Node, node2: Node) -> list:
+        '''
+        a与b交换所在的路径，各自插入到对方路径中距离增加最少的位置，不一定是对方原来的位置，路间，只有客户\n
+        插入位置只按距离选，两条新路径在评价时整条重新计算
+        '''
+        assert not node1==node2
+        if not (isinstance(node1, Customer) and isinstance(node2, Customer)):
+            return []
+        which1, where1, which2, where2 = Operation.find_two_customer(solution, node1, node2)
+        if which1 == which2:
+            return []
+        route1 = solution.routes[which1]
+        route2 = solution.routes[which2]
+        if route1.visit_index is None:
+            route1.find_visit_index()
+        if route2.visit_index is None:
+            route2.find_visit_index()
+        place1 = Operation.best_insert_place(model, np.delete(route1.visit_index, where1), node2)
+        place2 = Operation.best_insert_place(model, np.delete(route2.visit_index, where2), node1)
+        act = ((node1, node2), solution.id[which1], *Operation.find_left_right_station(route1, where1))
+        return [Move.swap_star(model, solution, which1, where1, which2, where2, place1, place2, act)]
+
 
 class Operation:
     @staticmethod
-    def choose_best_insert(solution: Solution, node: Node, route_indexes: list) -> tuple:
-        min_increase_dis_to_route = float('inf')
-        to_route = None
-        insert_place_to_route = None
-        for route_index in route_indexes:
-            min_increase_dis = float('inf')
-            insert_place = None
-            for place in range(1, len(solution.routes[route_index])):
-                increase_dis = node.distance_to(solution.routes[route_index].visit[place-1])+node.distance_to(solution.routes[route_index].visit[place])-solution.routes[route_index].visit[place-1].distance_to(solution.routes[route_index].visit[place])
-                if increase_dis < min_increase_dis:
-                    min_increase_dis = increase_dis
-                    insert_place = place
-            if min_increase_dis < min_increase_dis_to_route:
-                min_increase_dis_to_route = min_increase_dis
-                to_route = route_index
-                insert_place_to_route = insert_place
-        return to_route, insert_place_to_route
+    def insert_table(model: Model, route: Route) -> tuple:
+        '''
+        在route的每条边中插入点时检查要用的量，每条边一项\n
+        (前一点索引, 后一点索引, 前一点出发时刻, 后一点最晚到达时刻, 前一点及之前的最大载货量, 前一点及之后的最大载货量)\n
+        最晚到达时刻假设之后各点的服务和充电时间不变，晚到不超过它时之后的点都不会迟到\n
+        第k点到达时刻为max(t+A, B)，t为第i点到达时刻，A为i到k不含等待的时间，原来不迟到时B也不迟到，只需t+A不超过k的最晚时刻\n
+        原来已经迟到的点之前插入都不可能准时，最晚到达时刻为-inf
+        '''
+        vehicle = model.vehicle
+        if route.visit_index is None:
+            route.find_visit_index()
+        if route.arrive_load_weight is None:
+            route.cal_load_weight(vehicle)
+        if route.arrive_time is None:
+            route.cal_arrive_time(vehicle)
+        index = route.visit_index
+        arrive = route.arrive_time
+        travel = model.travel_time[index[:-1], index[1:]]
+        depart = arrive[1:]-travel
+        # 从k出发到k+1的时间加上k的服务和充电时间，不含等待
+        cost = np.zeros(len(index))
+        cost[:-1] = travel+depart-np.maximum(arrive[:-1], model.ready_time[index[:-1]])
+        # suffix[k]为从k出发到终点的时间，i到k的时间为suffix[i]-suffix[k]
+        suffix = np.cumsum(cost[::-1])[::-1]
+        over_time = np.where(arrive > model.over_time[index], float('-inf'), model.over_time[index])
+        latest = np.minimum.accumulate((over_time+suffix)[::-1])[::-1]-suffix
+        load = route.arrive_load_weight
+        return index[:-1], index[1:], depart, latest[1:], np.maximum.accumulate(load)[:-1], np.maximum.accumulate(load[::-1])[::-1][:-1]
+
+    @staticmethod
+    def insert_check(model: Model, table: tuple, node: Node) -> tuple:
+        '''
+        node插入table中每条边时的(距离增加, 两条边都可行, 到达时间可行, 载货量可行)
+        '''
+        prev, next, depart, latest, prefix_load, suffix_load = table
+        i = node.index
+        increase_dis = model.distance[prev, i]+model.distance[i, next]-model.distance[prev, next]
+        arc = model.arc_feasible[prev, i] & model.arc_feasible[i, next]
+        arrive = depart+model.travel_time[prev, i]
+        on_time = (arrive <= model.over_time[i]) & (np.maximum(arrive, model.ready_time[i])+model.service_time[i]+model.travel_time[i, next] <= latest)
+        if node.demand >= 0:
+            loadable = prefix_load+node.demand <= model.vehicle.capacity
+        else:
+            loadable = suffix_load-node.demand <= model.vehicle.capacity
+        return increase_dis, arc, on_time, loadable
+
+    @staticmethod
+    def best_insert(model: Model, tables: list, route_indexes: list, node: Node) -> tuple:
+        '''
+        一次比较所有路径的所有位置，tables为各路径的insert_table，返回(路径下标, 插入位置)\n
+        依次放宽条件：到达时间、载货量和边都可行，只有边可行，只看距离增加
+        '''
+        columns = tuple(np.concatenate(column) for column in zip(*tables))
+        length = [len(table[0]) for table in tables]
+        which = np.repeat(route_indexes, length)
+        place = np.arange(len(columns[0]))-np.repeat(np.cumsum(length)-length, length)+1
+        increase_dis, arc, on_time, loadable = Operation.insert_check(model, columns, node)
+        for possible in (arc & on_time & loadable, arc):
+            if np.any(possible):
+                increase_dis[~possible] = float('inf')
+                break
+        k = int(np.argmin(increase_dis))
+        return int(which[k]), int(place[k])
+
+    @staticmethod
+    def insert_nodes(solution: Solution, model: Model, nodes: list, route_indexes: list) -> None:
+        '''
+        按顺序把nodes逐个插入route_indexes中最好的位置，每次只重新计算被插入的路径
+        '''
+        tables = {}
+        for node in nodes:
+            for i in route_indexes:
+                if i not in tables:
+                    tables[i] = Operation.insert_table(model, solution.routes[i])
+            which, place = Operation.best_insert(model, [tables[i] for i in route_indexes], route_indexes, node)
+            solution.modify_route(which).add_node(model.vehicle, place, node)
+            del tables[which]
+
+    @staticmethod
+    def link_possible(model: Model, *links: tuple) -> bool:
+        for node1, node2 in links:
+            if not model.arc_feasible[node1.index, node2.index]:
+                return False
+        return True
+
+    @staticmethod
+    def two_opt_star_possible(model: Model, solution: Solution, first_which: int, first_where: int, second_which: int, second_where: int) -> bool:
+        visit1 = solution.routes[first_which].visit
+        visit2 = solution.routes[second_which].visit
+        return Operation.link_possible(model, (visit1[first_where], visit2[second_where+1]), (visit2[second_where], visit1[first_where+1]))
+
+    @staticmethod
+    def relocate_possible(model: Model, solution: Solution, which: int, where: int, new_which: int, new_where: int) -> bool:
+        visit = solution.routes[which].visit
+        new_visit = solution.routes[new_which].visit
+        node = visit[where]
+        return Operation.link_possible(model, (visit[where-1], visit[where+1]), (new_visit[new_where-1], node), (node, new_visit[new_where]))
+
+    @staticmethod
+    def exchange_possible(model: Model, solution: Solution, which1: int, where1: int, which2: int, where2: int) -> bool:
+        visit1 = solution.routes[which1].visit
+        visit2 = solution.routes[which2].visit
+        if which1 == which2 and abs(where1-where2) == 1:
+            i, j = min(where1, where2), max(where1, where2)
+            return Operation.link_possible(model, (visit1[i-1], visit1[j]), (visit1[j], visit1[i]), (visit1[i], visit1[j+1]))
+        return Operation.link_possible(model, (visit1[where1-1], visit2[where2]), (visit2[where2], visit1[where1+1]), (visit2[where2-1], visit1[where1]), (visit1[where1], visit2[where2+1]))
+
+    @staticmethod
+    def or_opt_possible(model: Model, solution: Solution, which: int, where: int, length: int, new_where: int) -> bool:
+        visit = solution.routes[which].visit
+        return Operation.link_possible(model, (visit[where-1], visit[where+length]), (visit[new_where-1], visit[where]), (visit[where+length-1], visit[new_where]))
+
+    @staticmethod
+    def two_opt_possible(model: Model, solution: Solution, which: int, where1: int, where2: int) -> bool:
+        '''
+        visit[where1:where2+1]反转后的所有边，时间窗使边的可行性与方向有关
+        '''
+        route = solution.routes[which]
+        if route.visit_index is None:
+            route.find_visit_index()
+        index = route.visit_index
+        if not (model.arc_feasible[index[where1-1], index[where2]] and model.arc_feasible[index[where1], index[where2+1]]):
+            return False
+        return bool(np.all(model.arc_feasible[index[where1+1:where2+1], index[where1:where2]]))
+
+    @staticmethod
+    def best_insert_place(model: Model, visit_index: np.ndarray, node: Node) -> int:
+        '''
+        node插入visit_index中距离增加最少的位置，先跳过会形成不可行边的位置，只看距离，不检查到达时间和载货量
+        '''
+        increase_dis = model.distance[visit_index[:-1], node.index]+model.distance[node.index, visit_index[1:]]-model.distance[visit_index[:-1], visit_index[1:]]
+        possible = model.arc_feasible[visit_index[:-1], node.index] & model.arc_feasible[node.index, visit_index[1:]]
+        if np.any(possible):
+            increase_dis[~possible] = float('inf')
+        return int(np.argmin(increase_dis))+1
+
+    @staticmethod
+    def is_station_candidate(model: Model, route: Route, where: int, recharger: Recharger) -> bool:
+        # 在where前插入的充电站要在候选表中，前面已经是这个充电站时是删除，总是可以
+        return route.visit[where-1] == recharger or recharger.index in model.station_table[route.visit[where-1].index, route.visit[where].index]
 
     @staticmethod
     def create_test_solution(model: Model) -> Solution:
         routes = []
         for cus in model.customers:
-            routes.append(Route([model.depot, cus, model.depot]))
+            routes.append(Route([model.depot, cus, model.depot], model))
         return Solution(routes)
 
     @staticmethod
@@ -709,124 +1240,33 @@ class Operation:
 
     @staticmethod
     def find_left_right_station(route: Route, where: int) -> tuple:
-        if where == 0:
-            left = route.visit[0]
-        else:
-            left_where = where-1
-            while not(isinstance(route.visit[left_where], Recharger)) and not(isinstance(route.visit[left_where], Depot)):
-                left_where -= 1
-            left = route.visit[left_where]
-        if where == len(route.visit)-1:
-            right = route.visit[-1]
-        else:
-            right_where = where+1
-            while not(isinstance(route.visit[right_where], Recharger)) and not(isinstance(route.visit[right_where], Depot)):
-                right_where += 1
-            right = route.visit[right_where]
-        return (left, right)
+        left_where, right_where = route.find_left_right_stop(where)
+        return (route.visit[left_where], route.visit[right_where])
 
     @staticmethod
     def find_left_station(route: Route, where: int) -> Node:
-        if where == 0:
-            left = route.visit[0]
-        else:
-            left_where = where-1
-            while not(isinstance(route.visit[left_where], Recharger)) and not(isinstance(route.visit[left_where], Depot)):
-                left_where -= 1
-            left = route.visit[left_where]
-        return left
+        return route.visit[route.find_left_right_stop(where)[0]]
 
     @staticmethod
     def find_right_station(route: Route, where: int) -> Node:
-        if where == len(route.visit)-1:
-            right = route.visit[-1]
-        else:
-            right_where = where+1
-            while not(isinstance(route.visit[right_where], Recharger)) and not(isinstance(route.visit[right_where], Depot)):
-                right_where += 1
-            right = route.visit[right_where]
-        return right
+        return route.visit[route.find_left_right_stop(where)[1]]
 
     @staticmethod
     def find_customer(solution: Solution, node: Customer) -> tuple:
-        flag = True
-        cur_which = 0
-        while cur_which < len(solution.routes) and flag:
-            cur_where = 1
-            while cur_where < len(solution.routes[cur_which].visit)-1 and flag:
-                cur_node = solution.routes[cur_which].visit[cur_where]
-                if cur_node==node:
-                    which = cur_which
-                    where = cur_where
-                    flag = False
-                cur_where += 1
-            cur_which += 1
-        return which, where
+        return solution.get_customer_position(node)
 
     @staticmethod
     def find_recharger(solution: Solution, node: Recharger) -> list:
-        recharger_which_where = []
-        cur_which = 0
-        while cur_which < len(solution.routes):
-            cur_where = 1
-            while cur_where < len(solution.routes[cur_which].visit)-1:
-                cur_node = solution.routes[cur_which].visit[cur_where]
-                if cur_node==node:
-                    recharger_which_where.append((cur_which, cur_where))
-                cur_where += 1
-            cur_which += 1
-        return recharger_which_where
+        return solution.get_station_position(node)
 
     @staticmethod
     def find_two_customer(solution: Solution, node1: Customer, node2: Customer) -> tuple:
-        flag = 0
-        which = 0
-        while which < len(solution.routes) and flag != 2:
-            where = 1
-            while where < len(solution.routes[which].visit)-1 and flag != 2:
-                node = solution.routes[which].visit[where]
-                if node==node1:
-                    which1 = which
-                    where1 = where
-                    flag += 1
-                elif node==node2:
-                    which2 = which
-                    where2 = where
-                    flag += 1
-                where += 1
-            which += 1
-        return which1, where1, which2, where2
+        return (*solution.get_customer_position(node1), *solution.get_customer_position(node2))
 
     @staticmethod
     def find_two_recharger(solution: Solution, node1: Recharger, node2: Recharger) -> tuple:
-        recharger1_which_where = []
-        recharger2_which_where = []
-        which = 0
-        while which < len(solution.routes):
-            where = 1
-            while where < len(solution.routes[which].visit)-1:
-                node = solution.routes[which].visit[where]
-                if node==node1:
-                    recharger1_which_where.append((which, where))
-                elif node==node2:
-                    recharger2_which_where.append((which, where))
-                where += 1
-            which += 1
-        return recharger1_which_where, recharger2_which_where
+        return solution.get_station_position(node1), solution.get_station_position(node2)
 
     @staticmethod
     def find_customer_recharger(solution: Solution, node1: Customer, node2: Recharger) -> tuple:
-        recharger2_which_where = []
-        which = 0
-        while which < len(solution.routes):
-            where = 1
-            while where < len(solution.routes[which].visit)-1:
-                node = solution.routes[which].visit[where]
-                if node==node1:
-                    which1 = which
-                    where1 = where
-                elif node==node2:
-                    recharger2_which_where.append((which, where))
-                where += 1
-            which += 1
-        return which1, where1, recharger2_which_where
+        return (*solution.get_customer_position(node1), solution.get_station_position(node2))
@@ -0,0 +1,66 @@
+import math
+import numpy as np
+
+
+class Grid:
+    '''
+    均匀网格空间索引，查询结果为点在建立索引时的序号\n
+    坐标只用于剪枝，排序用调用者给出的距离向量，保证与距离矩阵的结果完全一致
+    '''
+    # 构造属性
+    min_x = 0.0
+    min_y = 0.0
+    size = 1.0  # 网格边长
+    shape = (0, 0)  # x方向与y方向的网格数
+    cells = {}  # 网格坐标到其中点序号 字典
+    # 计算属性
+    num = 0
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, per_cell: float = 2.0) -> None:
+        self.num = len(x)
+        self.cells = {}
+        if self.num == 0:
+            return
+        self.min_x = float(np.min(x))
+        self.min_y = float(np.min(y))
+        width = float(np.max(x))-self.min_x
+        height = float(np.max(y))-self.min_y
+        area = max(width*height, max(width, height)**2/self.num, 1e-12)
+        self.size = (area*per_cell/self.num)**0.5
+        self.shape = (int(width/self.size)+1, int(height/self.size)+1)
+        cx = ((x-self.min_x)/self.size).astype(int)
+        cy = ((y-self.min_y)/self.size).astype(int)
+        for i, cell in enumerate(zip(cx.tolist(), cy.tolist())):
+            self.cells.setdefault(cell, []).append(i)
+
+    def cell_of(self, x: float, y: float) -> tuple:
+        cx = min(max(math.floor((x-self.min_x)/self.size), 0), self.shape[0]-1)
+        cy = min(max(math.floor((y-self.min_y)/self.size), 0), self.shape[1]-1)
+        return cx, cy
+
+    def ring(self, cell: tuple, r: int) -> list:
+        cx, cy = cell
+        ret = []
+        for i in range(max(cx-r, 0), min(cx+r, self.shape[0]-1)+1):
+            for j in range(max(cy-r, 0), min(cy+r, self.shape[1]-1)+1):
+                if max(abs(i-cx), abs(j-cy)) == r:
+                    ret.extend(self.cells.get((i, j), ()))
+        return ret
+
+    def nearest(self, x: float, y: float, k: int, distance: np.ndarray, exclude: tuple = ()) -> list:
+        '''
+        distance[i]为查询点到第i个点的距离，返回最近的k个点的序号，距离相同时序号小的在前
+        '''
+        k = min(k, self.num-len(exclude))
+        if k <= 0:
+            return []
+        cell = self.cell_of(x, y)
+        max_r = max(cell[0], cell[1], self.shape[0]-1-cell[0], self.shape[1]-1-cell[1])
+        found = []
+        for r in range(max_r+1):
+            found.extend(i for i in self.ring(cell, r) if i not in exclude)
+            # 还没查过的点距离都不小于r*size
+            if len(found) >= k and np.partition(distance[found], k-1)[k-1] < r*self.size*(1-1e-9):
+                break
+        found.sort(key=lambda i: (distance[i], i))
+        return found[:k]
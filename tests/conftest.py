@@ -0,0 +1,10 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(ROOT, 'data')
+sys.path.insert(0, ROOT)
+
+
+def data_path(*parts: str) -> str:
+    return os.path.join(DATA, *parts)
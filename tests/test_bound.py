@@ -0,0 +1,90 @@
+import io
+import random
+import contextlib
+import pytest
+
+from conftest import data_path
+from evrp.model import Model, Route, Solution
+
+pytest.importorskip('geatpy')  # evrp.operation经evrp.util导入geatpy
+from evrp.operation import Move, Modification
+from evrp.evolution import VNS_TS
+
+
+def read_model(name: str) -> Model:
+    model = Model(data_path('evrptw_instances', name+'.txt'), 'e')
+    model.read_data()
+    return model
+
+
+def solutions_of(model: Model, rng: random.Random) -> list:
+    # 随机的长路径大多不可行，长路径中再随机插入充电站，每个客户单独一条路径时大多可行
+    customers = model.customers[:]
+    rng.shuffle(customers)
+    long_routes = [[model.depot]+customers[i:i+8]+[model.depot] for i in range(0, len(customers), 8)]
+    for visit in long_routes[::2]:
+        visit.insert(rng.randint(1, len(visit)-1), rng.choice(model.rechargers))
+    single_routes = [[model.depot, customer, model.depot] for customer in customers]
+    return [Solution([Route(visit, model) for visit in long_routes]), Solution([Route(visit, model) for visit in single_routes])]
+
+
+def neighbor_of(model: Model, S: Solution) -> list:
+    with contextlib.redirect_stdout(io.StringIO()):
+        vns = VNS_TS(model)
+    names = ['two_opt_star', 'relocate', 'exchange', 'stationInRe', 'or_opt', 'two_opt', 'swap_star']
+    return [move for arc in vns.select_possible_arc(100) for name in names for move in getattr(Modification, name+'_arc')(model, S, *arc)]
+
+
+def customer_fingerprint(solution: Solution) -> int:
+    return sum(Solution.mix(route.get_fingerprint()) for route in solution.routes if not route.no_customer()) & 0xFFFFFFFFFFFFFFFF
+
+
+@pytest.mark.parametrize('name', ['c101_21', 'r201_21', 'rc102_21'])
+def test_bound_below_value(name, monkeypatch):
+    model = read_model(name)
+    rng = random.Random(0)
+    random.seed(0)
+    penalty = [10, 10, 10]
+    for S in solutions_of(model, rng):
+        surely = []
+        infeasible_routes = {i for i, route in enumerate(S.routes) if route.cal_penalty(model.vehicle)[4] is not None}
+        moves = neighbor_of(model, S)
+        monkeypatch.setattr(Move, 'first_batch', len(moves))  # 一批评价全部移动
+        Move.evaluate_moves(moves, model, penalty)
+        for move in moves:
+            num, objective, infeasible = move.bound
+            assert num == move.value[0]
+            assert objective <= move.value[1]+1e-9*abs(move.value[1])
+            assert not (infeasible and move.value[2])
+            # 未改动的路径中有不可行的路径时一定不可行
+            assert infeasible or infeasible_routes.issubset(move.pieces)
+            surely.append(infeasible)
+        # 由片段拼出的路径与action生成的解相同
+        for move in rng.sample(moves, 50):
+            assert move.fingerprint == customer_fingerprint(move.materialize(model))
+        if len(infeasible_routes) == 0:
+            assert not all(surely)
+
+
+@pytest.mark.parametrize('name', ['c101_21', 'r201_21', 'rc102_21'])
+def test_evaluate_moves_keeps_best(name, monkeypatch):
+    model = read_model(name)
+    rng = random.Random(1)
+    random.seed(1)
+    penalty = [10, 10, 10]
+    for S in solutions_of(model, rng):
+        moves = neighbor_of(model, S)
+        kept = Move.evaluate_moves(moves, model, penalty)
+        assert len(kept) < len(moves)
+        monkeypatch.setattr(Move, 'first_batch', len(moves))
+        Move.evaluate_moves(moves, model, penalty)
+        monkeypatch.undo()
+        expect = moves[0]
+        for move in moves[1:]:
+            if VNS_TS.compare_value(move.value, expect.value):
+                expect = move
+        best = kept[0]
+        for move in kept[1:]:
+            if VNS_TS.compare_value(move.value, best.value):
+                best = move
+        assert best is expect
@@ -0,0 +1,38 @@
+import shutil
+import numpy as np
+
+from conftest import data_path
+from evrp.model import Model
+
+
+def read_model(path: str) -> Model:
+    model = Model(path, 'e')
+    model.read_data()
+    return model
+
+
+def same_model(a: Model, b: Model) -> bool:
+    return all(np.array_equal(getattr(a, name), getattr(b, name)) for name in ['distance', 'demand', 'ready_time', 'over_time', 'arc_indptr', 'arc_indices', 'station_table'])
+
+
+def test_cache_roundtrip(tmp_path):
+    path = str(tmp_path/'c101_21.txt')
+    shutil.copy(data_path('evrptw_instances', 'c101_21.txt'), path)
+    first = read_model(path)
+    assert (tmp_path/'c101_21.npz').exists()
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == '.tmp'] == []
+    assert same_model(first, read_model(path))
+
+
+def test_corrupted_cache_is_rebuilt(tmp_path):
+    path = str(tmp_path/'c101_21.txt')
+    shutil.copy(data_path('evrptw_instances', 'c101_21.txt'), path)
+    expect = read_model(path)
+    cache = tmp_path/'c101_21.npz'
+    data = cache.read_bytes()
+    for broken in [data[:len(data)//2], data[:100], b'', b'not a zip file', data[:-200]+bytes(200)]:
+        cache.write_bytes(broken)
+        assert same_model(expect, read_model(path))
+        # 重新计算后写回完整的缓存
+        assert cache.read_bytes() != broken
+        assert same_model(expect, read_model(path))
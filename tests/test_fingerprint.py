@@ -0,0 +1,73 @@
+import random
+import pytest
+
+from conftest import data_path
+from evrp.model import Model, Route, Solution
+
+
+def read_model() -> Model:
+    model = Model(data_path('evrptw_instances', 'c101_21.txt'), 'e')
+    model.read_data()
+    return model
+
+
+def random_solution(model: Model, rng: random.Random) -> Solution:
+    customers = model.customers[:]
+    rng.shuffle(customers)
+    return Solution([Route([model.depot]+customers[i:i+8]+[model.depot], model) for i in range(0, len(customers), 8)])
+
+
+def test_fingerprint_order_independent():
+    model = read_model()
+    rng = random.Random(0)
+    S = random_solution(model, rng)
+    T = Solution([Route(route.visit[:], model) for route in reversed(S.routes)])
+    assert S == T and hash(S) == hash(T)
+    route = T.modify_route(0)
+    route.add_node(model.vehicle, 1, model.rechargers[0])
+    assert S != T
+
+
+def test_route_fingerprint_incremental():
+    model = read_model()
+    rng = random.Random(1)
+    pool = model.customers+model.rechargers
+    for _ in range(200):
+        route = Route([model.depot]+rng.sample(pool, rng.randint(1, 10))+[model.depot], model)
+        route.get_fingerprint()
+        route.add_node(model.vehicle, rng.randint(1, len(route.visit)-1), rng.choice(pool))
+        route.del_node(model.vehicle, rng.randint(1, len(route.visit)-2))
+        assert route.get_fingerprint() == Route(route.visit[:], model).get_fingerprint()
+
+
+def test_add_empty_route_resets_fingerprint():
+    model = read_model()
+    rng = random.Random(2)
+    S = random_solution(model, rng)
+    T = Solution([Route(route.visit[:], model) for route in S.routes])
+    S.get_fingerprint()
+    S.add_empty_route(model)
+    T.add_empty_route(model)
+    assert S == T and hash(S) == hash(T)
+    assert Solution.unique_index([S, T]) == [0]
+
+
+def test_evaluate_moves_drops_same_result(monkeypatch):
+    pytest.importorskip('geatpy')  # evrp.operation经evrp.util导入geatpy
+    from evrp.operation import Modification, Move
+    model = read_model()
+    rng = random.Random(3)
+    S = random_solution(model, rng)
+    moves = []
+    for _ in range(100):
+        node1, node2 = rng.sample(model.customers, 2)
+        for name in ['two_opt_star', 'relocate', 'exchange']:
+            moves += getattr(Modification, name+'_arc')(model, S, node1, node2)
+    monkeypatch.setattr(Move, 'first_batch', len(moves))  # 全部评价，不按下界跳过
+    kept = Move.evaluate_moves(moves, model, [10, 10, 10])
+    result = [move.materialize(model) for move in kept]
+    assert 0 < len(kept) < len(moves)
+    assert len(Solution.unique_index(result)) == len(result)
+    for move in moves:
+        if move not in kept:
+            assert any(move.materialize(model) == other for other in result)
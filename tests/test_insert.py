@@ -0,0 +1,61 @@
+import random
+import numpy as np
+import pytest
+
+from conftest import data_path
+from evrp.model import Model, Route
+
+pytest.importorskip('geatpy')  # evrp.operation经evrp.util导入geatpy
+from evrp.operation import Operation
+
+
+def routes_of(model: Model, rng: random.Random) -> list:
+    # 只有客户的路径，插入不改变充电时间，按开始时间依次加入仍准时的客户，另有几条打乱顺序后会迟到的路径
+    customers = sorted(model.customers, key=lambda cus: cus.ready_time)
+    ret = []
+    for _ in range(12):
+        visit = []
+        for cus in customers[rng.randrange(len(customers)//2):]:
+            route = Route([model.depot]+visit+[cus, model.depot], model)
+            if route.feasible_time(model.vehicle)[0] and route.feasible_capacity(model.vehicle)[0]:
+                visit.append(cus)
+            if len(visit) == 10:
+                break
+        if len(visit) == 0:
+            continue
+        if len(ret) % 4 == 3:
+            visit = rng.sample(visit, len(visit))
+        ret.append(Route([model.depot]+visit+[model.depot], model))
+    return ret
+
+
+def is_late(route: Route, start: int) -> bool:
+    # start之前的到达时间不受插入影响
+    return bool(np.any(route.arrive_time[start:] > route.model.over_time[route.visit_index[start:]]+1e-9))
+
+
+@pytest.mark.parametrize('name, file_type, negative_demand', [('solomon/c101.txt', 'tw', 0), ('solomon/r201.txt', 'tw', 0), ('solomon/rc101.txt', 'tw', 3), ('evrptw_instances/c101_21.txt', 'e', 0), ('evrptw_instances/r102_21.txt', 'e', 3)])
+def test_insert_table_matches_brute_force(name, file_type, negative_demand):
+    model = Model(data_path(*name.split('/')), file_type, negative_demand)
+    model.read_data()
+    vehicle = model.vehicle
+    rng = random.Random(name)
+    checked = accepted = 0
+    for route in routes_of(model, rng):
+        route.cal_load_weight(vehicle)
+        route.cal_arrive_time(vehicle)
+        table = Operation.insert_table(model, route)
+        capacity_ok = route.feasible_capacity(vehicle)[0]
+        for node in rng.sample([cus for cus in model.customers if cus not in route.visit], 15):
+            _, _, on_time, loadable = Operation.insert_check(model, table, node)
+            for k in range(len(route.visit)-1):
+                new_route = route.copy()
+                new_route.add_node(vehicle, k+1, node)
+                checked += 1
+                # 表判断准时当且仅当插入后插入的点和之后的点都不迟到
+                assert bool(on_time[k]) == (not is_late(new_route, k+1)), (route, node, k+1)
+                accepted += bool(on_time[k])
+                # 原来不超载时，表判断可装下的位置插入后也不超载
+                if capacity_ok and loadable[k]:
+                    assert new_route.feasible_capacity(vehicle)[0], (route, node, k+1)
+    assert 0 < accepted < checked
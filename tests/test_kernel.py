@@ -0,0 +1,69 @@
+import os
+import sys
+import glob
+import random
+import subprocess
+import importlib.util
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PENALTY = (15, 5, 10)
+
+
+def instance_files() -> list:
+    ret = []
+    for folder, file_type in [('evrptw_instances', 'e'), ('solomon', 'tw'), ('p', 'p'), ('small_evrptw_instances/Cplex5er', 's5'), ('small_evrptw_instances/Cplex10er', 's10'), ('small_evrptw_instances/Cplex15er', 's15')]:
+        ret.extend((path, file_type) for path in sorted(glob.glob(os.path.join(ROOT, 'data', folder, '*.txt'))))
+    return ret
+
+
+def objectives() -> list:
+    '''
+    在data下每个算例、两种耗电模型上生成随机路径并做插入删除，输出每一步的目标值、可行性和最后的剩余电量，浮点数用十六进制逐位比较
+    '''
+    from evrp.model import Model, Route
+    out = []
+    for path, file_type in instance_files():
+        for negative_demand, energy_model in [(0, 'linear'), (3, 'linear'), (0, 'load'), (3, 'load')]:
+            random.seed(os.path.basename(path)+str(negative_demand))
+            model = Model(path, file_type, negative_demand, use_cache=False, energy_model=energy_model)
+            model.read_data()
+            vehicle = model.vehicle
+            pool = model.customers+model.rechargers
+            for _ in range(10):
+                route = Route([model.depot]+random.sample(pool, random.randint(0, min(25, len(pool))))+[model.depot], model)
+                values = []
+                for _ in range(3):
+                    cost = route.cal_penalty(vehicle)
+                    values += [cost[0]+PENALTY[0]*cost[1]+PENALTY[1]*cost[2]+PENALTY[2]*cost[3], route.feasible(vehicle)]
+                    route.add_node(vehicle, random.randint(1, len(route.visit)-1), random.choice(pool))
+                    if len(route.visit) > 3:
+                        route.del_node(vehicle, random.randint(1, len(route.visit)-2))
+                route.cal_remain_battery(vehicle)
+                values += route.arrive_remain_battery.tolist()
+                out.append(' '.join(value.hex() if isinstance(value, float) else str(value) for value in values))
+    return out
+
+
+def run_backend(backend: str) -> list:
+    env = dict(os.environ, EVRP_KERNEL=backend)
+    result = subprocess.run([sys.executable, os.path.abspath(__file__)], env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+    return result.stdout.splitlines()
+
+
+@pytest.fixture(scope='module')
+def numpy_objectives() -> list:
+    return run_backend('numpy')
+
+
+@pytest.mark.parametrize('backend', ['python', 'numba'])
+def test_backend_parity(backend, numpy_objectives):
+    if backend == 'numba' and importlib.util.find_spec('numba') is None:
+        pytest.skip('numba is not installed')
+    assert len(numpy_objectives) == len(instance_files())*4*10
+    assert run_backend(backend) == numpy_objectives
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, ROOT)
+    print('\n'.join(objectives()))
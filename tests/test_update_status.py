@@ -0,0 +1,61 @@
+import random
+import numpy as np
+import pytest
+
+from conftest import data_path
+from evrp.model import Model, Route
+
+
+def square_energy(model: Model) -> tuple:
+    # 自定义耗电模型：耗电随距离的平方增加，载货量的影响与'load'相同
+    rate = model.distance*model.vehicle.battery_cost_speed
+    return rate*model.vehicle.net_weight+0.01*model.distance**2, rate
+
+
+def full_route(route: Route, vehicle: object) -> Route:
+    ret = Route(route.visit[:], route.model)
+    ret.cal_load_weight(vehicle)
+    ret.cal_remain_battery(vehicle)
+    ret.cal_arrive_time(vehicle)
+    return ret
+
+
+def edit(route: Route, vehicle: object, pool: list, rng: random.Random) -> None:
+    n = len(route.visit)
+    kind = rng.randrange(5)
+    if kind == 0 or n <= 3:
+        route.add_node(vehicle, rng.randint(1, n-1), rng.choice(pool))
+    elif kind == 1:
+        route.del_node(vehicle, rng.randint(1, n-2))
+    elif kind == 2:
+        route.replace_node(vehicle, rng.randint(1, n-2), rng.choice(pool))
+    elif kind == 3:
+        route.add_nodes(vehicle, rng.randint(1, n-1), rng.sample(pool, 2))
+    else:
+        start = rng.randint(1, n-2)
+        route.del_nodes(vehicle, start, min(start+2, n-1))
+
+
+@pytest.mark.parametrize('energy_model', ['linear', 'load', square_energy])
+@pytest.mark.parametrize('name', ['c101_21', 'r201_21', 'rc102_21'])
+def test_update_status_matches_full(name, energy_model):
+    model = Model(data_path('evrptw_instances', name+'.txt'), 'e', 3, energy_model=energy_model)
+    model.read_data()
+    vehicle = model.vehicle
+    rng = random.Random(name)
+    pool = model.customers+model.rechargers
+    for _ in range(50):
+        route = Route([model.depot]+rng.sample(pool, rng.randint(1, 15))+[model.depot], model)
+        route.cal_load_weight(vehicle)
+        route.cal_remain_battery(vehicle)
+        route.cal_arrive_time(vehicle)
+        route.cal_adjacent_distance()
+        for _ in range(6):
+            edit(route, vehicle, pool, rng)
+            expect = full_route(route, vehicle)
+            assert np.array_equal(route.visit_index, expect.visit_index)
+            assert np.array_equal(route.rechargers, expect.rechargers)
+            assert np.allclose(route.arrive_load_weight, expect.arrive_load_weight, rtol=1e-12, atol=1e-9)
+            assert np.allclose(route.arrive_remain_battery, expect.arrive_remain_battery, rtol=1e-12, atol=1e-9)
+            assert np.allclose(route.arrive_time, expect.arrive_time, rtol=1e-12, atol=1e-9)
+            assert np.allclose(route.adjacent_distance, model.distance[expect.visit_index[:-1], expect.visit_index[1:]])
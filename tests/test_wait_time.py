@@ -0,0 +1,82 @@
+import random
+import numpy as np
+import pytest
+
+from conftest import data_path
+from evrp.model import Model, Route
+
+
+def old_wait_time(arrive_time: np.ndarray, ready_time: np.ndarray) -> np.ndarray:
+    # user-011之前的逐个等待点平移后缀的写法
+    arrive_time = arrive_time.copy()
+    done = 0
+    while True:
+        need_process = np.where(arrive_time < ready_time)[0]
+        if len(need_process) == done:
+            break
+        i = need_process[done]
+        arrive_time[i+1:] += ready_time[i]-arrive_time[i]
+        done += 1
+    return arrive_time
+
+
+def no_wait_arrive_time(route: Route) -> np.ndarray:
+    model = route.model
+    travel_time = np.zeros(len(route.visit))
+    travel_time[1:] = model.travel_time[route.visit_index[:-1], route.visit_index[1:]]
+    service_time = np.zeros(len(route.visit))
+    service_time[1:] = np.cumsum(model.service_time[route.visit_index])[:-1]
+    return np.cumsum(travel_time)+service_time
+
+
+def long_routes(model: Model) -> list:
+    # 按开始时间排序的客户组成的路径会在很多点早到等待
+    rng = random.Random(0)
+    customers = sorted(model.customers, key=lambda cus: cus.ready_time)
+    ret = [customers, customers[::2], customers[::-1]]
+    for _ in range(5):
+        start = rng.randrange(len(customers)//2)
+        ret.append(customers[start:start+rng.randrange(10, len(customers)//2)])
+    return [Route([model.depot]+visit+[model.depot], model) for visit in ret]
+
+
+@pytest.mark.parametrize('name', ['c101', 'c201', 'r101', 'r201', 'rc101', 'rc201'])
+def test_wait_time_matches_old_loop(name):
+    model = Model(data_path('solomon', name+'.txt'), 'tw')
+    model.read_data()
+    waits = 0
+    for route in long_routes(model):
+        route.cal_arrive_time(model.vehicle)
+        ready_time = model.ready_time[route.visit_index]
+        expect = old_wait_time(no_wait_arrive_time(route), ready_time)
+        # 只在舍入上不同，容差见Route.add_wait_time
+        assert np.allclose(route.arrive_time, expect, rtol=1e-12, atol=1e-9)
+        waits += int(np.sum(route.arrive_time < ready_time))
+        # 从中间开始重新计算后缀
+        index = len(route.visit)//3
+        route.arrive_time[index+1:] = 0
+        route.cal_arrive_time_after_index(model.vehicle, index)
+        assert np.allclose(route.arrive_time, expect, rtol=1e-12, atol=1e-9)
+    assert waits > 0
+
+
+def test_arrive_time_after_index_keeps_copy_source():
+    model = Model(data_path('solomon', 'r101.txt'), 'tw')
+    model.read_data()
+    route = long_routes(model)[0]
+    route.cal_arrive_time(model.vehicle)
+    expect = route.arrive_time.copy()
+    other = route.copy()  # 与route共用arrive_time
+    other.cal_arrive_time_after_index(model.vehicle, len(route.visit)//3)
+    assert other.arrive_time is not route.arrive_time
+    assert np.array_equal(route.arrive_time, expect)
+
+
+def test_wait_time_random_sequences():
+    rng = np.random.default_rng(0)
+    for n in [1, 2, 3, 10, 100, 1000]:
+        for _ in range(20):
+            arrive_time = np.cumsum(rng.uniform(0, 10, n))
+            ready_time = arrive_time+rng.uniform(-20, 15, n)
+            expect = old_wait_time(arrive_time, ready_time)
+            assert np.allclose(Route.add_wait_time(arrive_time.copy(), ready_time), expect, rtol=1e-12, atol=1e-9)